@@ -0,0 +1,162 @@
+import os
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+# File written by export_model.py for each exported backend (next to the .pth checkpoint)
+EXPORT_SUFFIXES = {
+    'torchscript': '.torchscript.pt',
+    'onnxruntime': '.onnx',
+    'int8': '.int8.torchscript.pt',
+}
+
+def exported_model_path(model_path, backend):
+    """e.g. models/alzheimer_resnet50_best.pth -> models/alzheimer_resnet50_best.onnx"""
+    return os.path.splitext(model_path)[0] + EXPORT_SUFFIXES[backend]
+
+class FeatureMapResNet(nn.Module):
+    """
+    Wraps the ResNet-50 classifier so the forward pass returns BOTH the logits
+    and the layer4 feature map. This is the graph we export: Grad-CAM only
+    needs the feature map plus the (eager) head, so it keeps working through
+    TorchScript / ONNX Runtime. Submodules are shared with `model`, not copied.
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.features = nn.Sequential(
+            model.conv1, model.bn1, model.relu, model.maxpool,
+            model.layer1, model.layer2, model.layer3, model.layer4
+        )
+        self.avgpool = model.avgpool
+        self.fc = model.fc
+
+    def forward(self, x):
+        fmap = self.features(x)
+        logits = self.fc(torch.flatten(self.avgpool(fmap), 1))
+        return logits, fmap
+
+# --- INFERENCE-OPTIMIZED BUILD ---
+def fold_batchnorm(module):
+    """
+    Folds every eval-mode BatchNorm2d into the Conv2d registered right before it
+    (conv1/bn1, conv2/bn2, ... and the downsample Sequential in torchvision ResNets).
+    The BN modules are replaced by nn.Identity, so the module tree - and with it
+    model.layer4[-1] for Grad-CAM - keeps its shape. Works in place.
+    """
+    prev_name, prev_child = None, None
+    for name, child in list(module.named_children()):
+        if isinstance(child, nn.BatchNorm2d) and isinstance(prev_child, nn.Conv2d):
+            setattr(module, prev_name, fuse_conv_bn_eval(prev_child, child))
+            setattr(module, name, nn.Identity())
+        else:
+            fold_batchnorm(child)
+        prev_name, prev_child = name, child
+    return module
+
+def optimize_model(model, channels_last=True):
+    """Conv-BN folding + channels_last weights. Call after load_state_dict() and eval()."""
+    fold_batchnorm(model)
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+    return model
+
+# --- BACKENDS ---
+# Every backend is a callable: (N, 3, 224, 224) batch -> (logits, layer4 feature map)
+
+class EagerBackend:
+    """
+    PyTorch model; the feature map is captured by the Grad-CAM engine hook.
+    Optionally the hook-free FeatureMapResNet graph is compiled instead:
+      - compile_mode="inductor": torch.compile
+      - compile_mode="onednn":   traced + frozen TorchScript with oneDNN graph fusion
+    """
+    name = 'eager'
+
+    def __init__(self, model, gradcam, channels_last=False, compile_mode=None):
+        self.model = model
+        self.gradcam = gradcam
+        self.memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        self.graph = None
+
+        if compile_mode == 'inductor':
+            self.graph = torch.compile(FeatureMapResNet(model))
+        elif compile_mode == 'onednn':
+            torch.jit.enable_onednn_fusion(True)
+            example = torch.randn(1, 3, 224, 224).contiguous(memory_format=self.memory_format)
+            with torch.no_grad():
+                self.graph = torch.jit.freeze(torch.jit.trace(FeatureMapResNet(model), example))
+        elif compile_mode is not None:
+            raise ValueError(f"Unknown compile mode: {compile_mode}")
+
+        if compile_mode:
+            self.name = f"eager ({compile_mode})"
+            # The first calls trigger compilation / fusion, do it at load time
+            for _ in range(2):
+                self(torch.randn(1, 3, 224, 224))
+
+    def __call__(self, batch):
+        batch = batch.contiguous(memory_format=self.memory_format)
+        with torch.inference_mode():
+            if self.graph is not None:
+                return self.graph(batch)
+            with self.gradcam.capture() as ctx:
+                logits = self.model(batch)
+        return logits, ctx.activations
+
+class TorchScriptBackend:
+    """
+    Frozen TorchScript graph produced by export_model.py, or the INT8 graph
+    produced by quantize_model.py (which records its quantized engine).
+    """
+    name = 'torchscript'
+
+    def __init__(self, path, device, name='torchscript'):
+        self.name = name
+        extra_files = {'quant_engine': ''}
+        self.module = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+        self.module.eval()
+
+        engine = extra_files['quant_engine']
+        if isinstance(engine, bytes): engine = engine.decode()
+        if engine:
+            # Quantized kernels must run on the engine the model was calibrated for
+            torch.backends.quantized.engine = engine
+
+    def __call__(self, batch):
+        with torch.inference_mode():
+            return self.module(batch)
+
+class OnnxRuntimeBackend:
+    """ONNX graph produced by export_model.py, run by ONNX Runtime on the CPU."""
+    name = 'onnxruntime'
+
+    def __init__(self, path):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnxruntime is not installed. (pip install onnxruntime)")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, batch):
+        logits, fmap = self.session.run(['logits', 'fmap'], {'input': batch.cpu().numpy()})
+        return torch.from_numpy(logits), torch.from_numpy(fmap)
+
+def load_backend(name, model, gradcam, model_path, device, channels_last=False, compile_mode=None):
+    """Builds the inference backend `name` (eager / torchscript / onnxruntime / int8)."""
+    if name == 'eager':
+        return EagerBackend(model, gradcam, channels_last, compile_mode)
+
+    if name not in EXPORT_SUFFIXES:
+        raise ValueError(f"Unknown inference backend: {name}")
+
+    path = exported_model_path(model_path, name)
+    if not os.path.exists(path):
+        tool = "quantize_model.py" if name == 'int8' else "export_model.py"
+        raise FileNotFoundError(f"Exported model not found at {path} (run {tool} first)")
+
+    if name in ('torchscript', 'int8'):
+        return TorchScriptBackend(path, device, name)
+    return OnnxRuntimeBackend(path)
@@ -0,0 +1,172 @@
+"""
+Batch scoring of a research cohort from the command line.
+
+Walks a directory for .nii/.nii.gz/.jpg/.jpeg/.png/.bmp scans, preprocesses
+upcoming scans in a small pool (pipeline.PrefetchPipeline) while the current
+batch runs through ResNet-50, and streams one result per scan to a JSONL or CSV file (flushed as
+it goes). Optionally writes a Grad-CAM overlay PNG per scan.
+
+Resume: rerunning with the same --output skips every scan already recorded there.
+Memory stays bounded: only --batch-size + --prefetch scans are held at a time.
+
+Usage:
+    python batch_score.py cohort/ --output results.jsonl --heatmaps heatmaps/
+    python batch_score.py cohort/ --output results.csv --batch-size 32
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from tqdm import tqdm
+from inference import AlzheimerPredictor
+from pipeline import PrefetchPipeline
+from tensor_store import TensorStore
+
+# --- CONFIGURATION ---
+DEFAULT_MODEL_PATH = "models/alzheimer_resnet50_best.pth"
+SCAN_EXTENSIONS = ('.nii', '.nii.gz', '.jpg', '.jpeg', '.png', '.bmp')
+FIELDS = ["path", "prediction", "confidence", "heatmap", "error"]
+
+def find_scans(root):
+    """Yields scan paths relative to root, in a stable (sorted) order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for file in sorted(filenames):
+            if file.lower().endswith(SCAN_EXTENSIONS):
+                yield os.path.relpath(os.path.join(dirpath, file), root)
+
+def drop_partial_line(output_path, chunk_size=64 * 1024):
+    """
+    Truncates the file after its last newline, removing the half-written row an
+    interrupted run may have left (new rows would otherwise be glued onto it).
+    """
+    if not os.path.exists(output_path): return
+    with open(output_path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk_size)
+            f.seek(start)
+            newline = f.read(pos - start).rfind(b"\n")
+            if newline >= 0:
+                pos = start + newline + 1
+                break
+            pos = start
+        if pos < end:
+            print(f"⚠️ Dropping a partial last row from {output_path}")
+            f.truncate(pos)
+
+def load_done(output_path):
+    """Relative paths already recorded in a previous (possibly interrupted) run."""
+    done = set()
+    if not os.path.exists(output_path): return done
+    drop_partial_line(output_path)
+
+    with open(output_path, newline='') as f:
+        if output_path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                done.add(row["path"])
+        else:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    pass
+    return done
+
+class ResultWriter:
+    """Appends one row per scan to JSONL or CSV, flushing every row."""
+    def __init__(self, output_path):
+        self.is_csv = output_path.endswith('.csv')
+        drop_partial_line(output_path)
+        is_new = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self.file = open(output_path, 'a', newline='')
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+            if is_new: self.writer.writeheader()
+
+    def write(self, row):
+        if self.is_csv:
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def score_batch(predictor, batch, writer, heatmap_dir):
+    """Runs one forward pass for the batch and writes its rows."""
+    results = predictor.predict_planes([planes for _, planes in batch])
+    for (rel_path, _), result in zip(batch, results):
+        heatmap_path = ""
+        if heatmap_dir:
+            heatmap_path = os.path.join(heatmap_dir, rel_path.replace(os.sep, "__") + ".png")
+            result.heatmap().save(heatmap_path)
+        writer.write({"path": rel_path, "prediction": result.class_name,
+                      "confidence": round(result.confidence, 4), "heatmap": heatmap_path, "error": ""})
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a directory of MRI scans")
+    parser.add_argument("input_dir", help="Directory to walk for scans")
+    parser.add_argument("--output", required=True, help="Results file (.jsonl or .csv)")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", default="eager", help="eager / torchscript / onnxruntime / int8")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--prefetch", type=int, default=32, help="Scans preprocessed ahead of inference")
+    parser.add_argument("--workers", type=int, default=4, help="Preprocessing workers")
+    parser.add_argument("--pipeline-mode", default="thread", choices=["thread", "process"],
+                        help="Preprocess in threads or in worker processes")
+    parser.add_argument("--heatmaps", default=None, help="Directory for Grad-CAM overlay PNGs")
+    parser.add_argument("--tensor-store", default=None,
+                        help="Directory of preprocessed slices to reuse/fill (re-scoring then skips preprocessing)")
+    args = parser.parse_args()
+
+    if args.heatmaps: os.makedirs(args.heatmaps, exist_ok=True)
+
+    # 1. Resume: skip everything already in the output
+    done = load_done(args.output)
+    paths = [p for p in find_scans(args.input_dir) if p not in done]
+    print(f"📂 {len(paths)} scans to score ({len(done)} already done)")
+    if not paths: return
+
+    predictor = AlzheimerPredictor(args.model, backend=args.backend, optimize=args.backend == "eager")
+    if args.tensor_store:
+        predictor.preprocessor.tensor_store = TensorStore(args.tensor_store)
+    writer = ResultWriter(args.output)
+    pipeline = PrefetchPipeline(predictor.preprocessor, depth=args.prefetch, workers=args.workers,
+                                mode=args.pipeline_mode)
+    start = time.perf_counter()
+
+    # 2. Stream: preprocess ahead, batch, score, write
+    try:
+        batch = []
+        with tqdm(total=len(paths), unit="scan") as progress:
+            for full_path, planes, error in pipeline.map(os.path.join(args.input_dir, p) for p in paths):
+                rel_path = os.path.relpath(full_path, args.input_dir)
+                if planes is None:
+                    writer.write({"path": rel_path, "prediction": "Error", "confidence": 0.0,
+                                  "heatmap": "", "error": error or "Could not preprocess scan"})
+                    progress.update(1)
+                    continue
+
+                batch.append((rel_path, planes))
+                if len(batch) >= args.batch_size:
+                    score_batch(predictor, batch, writer, args.heatmaps)
+                    progress.update(len(batch))
+                    batch = []
+                progress.set_postfix(scans_per_s=f"{progress.n / (time.perf_counter() - start):.1f}")
+
+            if batch:
+                score_batch(predictor, batch, writer, args.heatmaps)
+                progress.update(len(batch))
+    finally:
+        pipeline.close()
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Scored {len(paths)} scans in {elapsed:.1f}s ({len(paths) / elapsed:.1f} scans/s) -> {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Inference latency / throughput benchmark.
+
+Needs no checkpoint and no dataset: a randomly initialized model is saved to a
+temporary .pth and synthetic JPEGs / NIfTI volumes are generated locally, so
+the numbers only reflect the code in inference.py and preprocessing.py.
+
+Measures:
+  - cold start (fresh process: imports excluded, model load + predictor setup)
+  - single-scan latency p50/p95/p99 (JPEG and NIfTI, end to end via predict());
+    NIfTI is split into cold (first read of each volume: HD-BET, hashing, gzip
+    index, slice scoring) and warm (repeat reads served by the derived-data caches,
+    which live in the temporary directory, never in ./cache)
+  - batched throughput across batch sizes and intra-op thread counts
+  - Grad-CAM overhead (heatmap() on top of predict())
+  - per-stage latency histograms (preprocess / forward / Grad-CAM / overlay, see profiling.py)
+  - peak RSS
+
+Output is one JSON document (stdout, or --output) so runs can be compared over time.
+
+Usage:
+    python benchmark.py --output bench/2026-10-16.json
+    python benchmark.py --quick
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+import nibabel as nib
+from PIL import Image
+from inference import AlzheimerPredictor
+from preprocessing import Preprocessor
+from profiling import STAGE_HISTOGRAMS
+
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+def percentiles(samples_ms):
+    samples = np.array(samples_ms)
+    return {
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "runs": len(samples),
+    }
+
+def peak_rss_mb():
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return round(peak / 1e6 if sys.platform == "darwin" else peak / 1e3, 1)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+# --- SYNTHETIC DATA ---
+def synthetic_slice(size, rng):
+    """Bright ellipse ('brain') with darker blobs ('ventricles') and noise."""
+    yy, xx = np.mgrid[:size, :size] / size - 0.5
+    image = (xx ** 2 / 0.16 + yy ** 2 / 0.2 < 1) * 0.7
+    image -= (xx ** 2 / 0.005 + (yy + 0.05) ** 2 / 0.02 < 1) * 0.4
+    image += rng.normal(0, 0.05, (size, size))
+    return np.clip(image, 0, 1)
+
+def make_synthetic_data(directory, num_jpegs, num_volumes, rng):
+    jpegs, volumes = [], []
+    for i in range(num_jpegs):
+        path = os.path.join(directory, f"scan_{i}.jpg")
+        Image.fromarray((synthetic_slice(496, rng) * 255).astype(np.uint8)).convert('RGB').save(path, quality=95)
+        jpegs.append(path)
+    for i in range(num_volumes):
+        path = os.path.join(directory, f"volume_{i}.nii.gz")
+        # Identity affine = RAS: the axial slices must be stacked along the last (S) axis
+        volume = np.stack([synthetic_slice(256, rng) * 1000 for _ in range(176)], axis=-1).astype(np.float32)
+        nib.save(nib.Nifti1Image(volume, np.eye(4)), path)
+        volumes.append(path)
+    return jpegs, volumes
+
+def make_random_checkpoint(path):
+    torch.manual_seed(0)
+    torch.save(AlzheimerPredictor._build_model().state_dict(), path)
+
+# --- MEASUREMENTS ---
+def measure_cold_start(model_path, runs):
+    """Model load time in fresh processes (page cache warm after the first run)."""
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--cold-start-probe", model_path],
+                             capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1])["load_ms"])
+    return percentiles(samples)
+
+def measure_latency(predictor, paths, runs):
+    # Warm-up (first calls pay for lazy allocations)
+    predictor.predict(paths[0])
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        predictor.predict(paths[i % len(paths)])
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentiles(samples)
+
+def measure_nifti_latency(predictor, paths, runs):
+    """
+    Cold: the first predict() of each volume, so every per-scan cost is included
+    (no warm-up call on these files). Warm: `runs` repeat reads of the same volumes.
+    """
+    cold = []
+    for path in paths:
+        start = time.perf_counter()
+        predictor.predict(path)
+        cold.append((time.perf_counter() - start) * 1000)
+    return {"cold": percentiles(cold), "warm": measure_latency(predictor, paths, runs)}
+
+def measure_gradcam_overhead(predictor, paths, runs):
+    predict_ms, heatmap_ms = [], []
+    for i in range(runs):
+        start = time.perf_counter()
+        result = predictor.predict(paths[i % len(paths)])
+        mid = time.perf_counter()
+        result.heatmap()
+        end = time.perf_counter()
+        predict_ms.append((mid - start) * 1000)
+        heatmap_ms.append((end - mid) * 1000)
+    return {"predict": percentiles(predict_ms), "heatmap": percentiles(heatmap_ms),
+            "overhead_pct": round(100 * float(np.mean(heatmap_ms)) / float(np.mean(predict_ms)), 2)}
+
+def measure_throughput(predictor, batch_sizes, thread_counts, runs):
+    """Model-only throughput (preprocessing excluded) for every batch size x thread count."""
+    results = []
+    default_threads = torch.get_num_threads()
+    for threads in thread_counts:
+        torch.set_num_threads(threads)
+        for batch_size in batch_sizes:
+            tensors = [torch.randn(1, 3, 224, 224) for _ in range(batch_size)]
+            predictor.predict_tensors(tensors) # Warm-up
+            start = time.perf_counter()
+            for _ in range(runs):
+                predictor.predict_tensors(tensors)
+            elapsed = time.perf_counter() - start
+            results.append({"threads": threads, "batch_size": batch_size,
+                            "images_per_s": round(batch_size * runs / elapsed, 2),
+                            "batch_ms": round(1000 * elapsed / runs, 3)})
+    torch.set_num_threads(default_threads)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference latency / throughput benchmark")
+    parser.add_argument("--output", default=None, help="Write JSON here (default: stdout)")
+    parser.add_argument("--quick", action="store_true", help="Fewer runs, for a fast smoke check")
+    parser.add_argument("--backend", default="eager")
+    parser.add_argument("--optimize", action="store_true", help="Benchmark the optimized eager build")
+    parser.add_argument("--skip-nifti", action="store_true")
+    parser.add_argument("--cold-start-probe", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start_probe:
+        start = time.perf_counter()
+        AlzheimerPredictor(args.cold_start_probe)
+        print(json.dumps({"load_ms": (time.perf_counter() - start) * 1000}))
+        return
+
+    runs = 5 if args.quick else 50
+    cpu_count = os.cpu_count() or 1
+    thread_counts = sorted({1, max(1, cpu_count // 2), cpu_count})
+    batch_sizes = [1, 4, 16] if args.quick else [1, 2, 4, 8, 16, 32]
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, "random_resnet50.pth")
+        make_random_checkpoint(model_path)
+        num_volumes = 0 if args.skip_nifti else (3 if args.quick else 6)
+        jpegs, volumes = make_synthetic_data(tmp, num_jpegs=8, num_volumes=num_volumes, rng=rng)
+
+        report = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpu_count": cpu_count,
+            "backend": args.backend,
+            "optimize": args.optimize,
+            "cold_start": measure_cold_start(model_path, 3 if args.quick else 5),
+        }
+
+        predictor = AlzheimerPredictor(model_path, backend=args.backend, optimize=args.optimize)
+        # Brain masks, gzip indexes and slice choices persisted like a deployment would,
+        # but inside the temporary directory
+        predictor.preprocessor = Preprocessor(cache_dir=os.path.join(tmp, "cache"))
+        report["latency_jpeg"] = measure_latency(predictor, jpegs, runs)
+        if volumes:
+            # HD-BET's one-time model load is not a per-scan cost
+            predictor.preprocessor.skull_stripper.warm_up()
+            report["latency_nifti"] = measure_nifti_latency(predictor, volumes, max(3, runs // 5))
+        report["gradcam"] = measure_gradcam_overhead(predictor, jpegs, runs)
+        report["stages"] = STAGE_HISTOGRAMS.snapshot()
+        report["throughput"] = measure_throughput(predictor, batch_sizes, thread_counts, 3 if args.quick else 10)
+        report["peak_rss_mb"] = peak_rss_mb()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"✅ Benchmark written to {args.output}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Root of every persistent cache (AlzheimerPredictor(cache=True))
+CACHE_DIR = "cache"
+
+class LRUCache:
+    """Bounded, thread-safe in-memory LRU mapping."""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data: return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Digests of recently hashed files (see file_digest)
+_digests = LRUCache(256)
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    SHA-256 (hex) of a file's content, read in chunks.
+    Memoized by (path, inode, size, mtime): the tensor store, prediction cache,
+    brain mask cache and gzip index all key on the same scan, which is then
+    hashed once per request instead of once per cache.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_ino, st.st_size, st.st_mtime_ns)
+    digest = _digests.get(memo_key)
+    if digest is not None: return digest
+
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    _digests.put(memo_key, digest)
+    return digest
+
+class DiskCache:
+    """
+    Directory of files named after their key, bounded by total size.
+    Every hit refreshes the file's mtime, so when the directory grows past
+    max_bytes the least recently used files are evicted first.
+    """
+    def __init__(self, directory, max_bytes, suffix):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Returns the path of the cached file for `key` (or None), marking it as used."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, write_fn):
+        """
+        Stores an entry. write_fn(tmp_path) writes the file; it is then moved into
+        place atomically so readers never see half-written entries.
+        Returns the final path.
+        """
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{self.suffix}"
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith(self.suffix) and '.tmp' not in entry.name:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes: break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
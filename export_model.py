@@ -0,0 +1,92 @@
+"""
+Exports the trained classifier for graph-optimized CPU inference.
+
+Writes next to the .pth checkpoint:
+  - <name>.torchscript.pt  (traced + frozen TorchScript)   -> backend="torchscript"
+  - <name>.onnx            (ONNX, dynamic batch axis)       -> backend="onnxruntime"
+  - <name>.stripped.pth    (DataParallel prefix removed, picked up automatically
+                            by AlzheimerPredictor for a faster, rewrite-free load)
+
+The TorchScript and ONNX graphs return (logits, layer4 feature map), so Grad-CAM keeps working
+when AlzheimerPredictor runs on an exported backend.
+
+Usage:
+    python export_model.py --model models/alzheimer_resnet50_best.pth --format torchscript onnx
+    python export_model.py --model models/alzheimer_resnet50_best.pth --format stripped
+"""
+import argparse
+import torch
+from inference import AlzheimerPredictor, strip_dataparallel_prefix, stripped_checkpoint_path
+from backends import FeatureMapResNet, exported_model_path, load_backend
+
+# --- CONFIGURATION ---
+DEFAULT_MODEL_PATH = "models/alzheimer_resnet50_best.pth"
+ONNX_OPSET = 17
+
+def export_torchscript(wrapper, example, path):
+    with torch.no_grad():
+        traced = torch.jit.trace(wrapper, example)
+        frozen = torch.jit.freeze(traced)
+    frozen.save(path)
+
+def export_onnx(wrapper, example, path):
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper, example, path,
+            input_names=['input'],
+            output_names=['logits', 'fmap'],
+            dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}, 'fmap': {0: 'batch'}},
+            opset_version=ONNX_OPSET,
+        )
+
+def export_stripped_checkpoint(model_path):
+    """One-time conversion: saves the state dict with the 'module.' prefixes already removed."""
+    path = stripped_checkpoint_path(model_path)
+    print(f"📦 Exporting stripped checkpoint -> {path}")
+    state_dict = torch.load(model_path, map_location="cpu", weights_only=True)
+    torch.save(strip_dataparallel_prefix(state_dict), path)
+    print("✅ AlzheimerPredictor will load it automatically (memory-mapped)")
+
+def verify_export(predictor, backend_name, example):
+    """Compares the exported graph against the eager model on the same input."""
+    backend = load_backend(backend_name, predictor.model, predictor.gradcam,
+                           predictor.model_path, predictor.device)
+    ref_logits, ref_fmap = predictor.backend(example)
+    logits, fmap = backend(example)
+    logits_diff = (ref_logits - logits).abs().max().item()
+    fmap_diff = (ref_fmap - fmap).abs().max().item()
+    print(f"   Max abs diff vs eager: logits={logits_diff:.2e}, fmap={fmap_diff:.2e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Alzheimer ResNet-50 to TorchScript / ONNX")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path to the trained .pth checkpoint")
+    parser.add_argument("--format", nargs="+", default=["torchscript", "onnx"],
+                        choices=["torchscript", "onnx", "stripped"], help="Export format(s)")
+    args = parser.parse_args()
+
+    if "stripped" in args.format:
+        export_stripped_checkpoint(args.model)
+        args.format = [fmt for fmt in args.format if fmt != "stripped"]
+        if not args.format: return
+
+    predictor = AlzheimerPredictor(args.model)
+    wrapper = FeatureMapResNet(predictor.model).eval()
+    example = torch.randn(2, 3, 224, 224)
+
+    exporters = {
+        'torchscript': ('torchscript', export_torchscript),
+        'onnx': ('onnxruntime', export_onnx),
+    }
+    for fmt in args.format:
+        backend_name, exporter = exporters[fmt]
+        path = exported_model_path(args.model, backend_name)
+        print(f"📦 Exporting {fmt} -> {path}")
+        exporter(wrapper, example, path)
+        try:
+            verify_export(predictor, backend_name, example)
+        except ImportError as e:
+            print(f"⚠️ Skipping verification: {e}")
+        print(f"✅ Use AlzheimerPredictor(model_path, backend=\"{backend_name}\")")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import threading
+from contextlib import contextmanager
+import torch
+
+class CaptureContext:
+    """Per-request state: the target layer activations of one forward pass."""
+    def __init__(self):
+        self.activations = None
+
+class GradCAM:
+    """
+    Reusable, thread-safe Grad-CAM engine.
+
+    - The forward hook on the target layer is installed ONCE, not per call.
+    - Captured activations go into a per-request CaptureContext (thread-local),
+      so one model can serve several worker threads without racing.
+    - Model parameters are frozen. Gradients are only computed through `head`
+      (the part of the network after the target layer) down to the target
+      layer output, never for the 25M backbone parameters.
+    """
+    def __init__(self, model, target_layer, head):
+        self.model = model
+        self.head = head
+        self._local = threading.local()
+
+        for param in model.parameters():
+            param.requires_grad_(False)
+
+        self._handle = target_layer.register_forward_hook(self._capture_hook)
+
+    def _capture_hook(self, module, input, output):
+        context = getattr(self._local, 'context', None)
+        if context is not None:
+            context.activations = output
+
+    @contextmanager
+    def capture(self):
+        """
+        Records the target layer output of every forward pass run inside the block.
+        Usage:
+            with engine.capture() as ctx:
+                output = model(x)
+            cams = engine.compute(ctx.activations, class_idx)
+        """
+        context = CaptureContext()
+        previous = getattr(self._local, 'context', None)
+        self._local.context = context
+        try:
+            yield context
+        finally:
+            self._local.context = previous
+
+    def compute(self, activations, class_idx):
+        """
+        Returns: (N, H, W) numpy array with the CAM of class_idx[i] for sample i.
+        Activations may come from torch.inference_mode(); only the head is re-run.
+        """
+        # clone() outside inference mode turns cached inference tensors into normal ones
+        fmap = activations.clone().requires_grad_(True)
+        index = class_idx.clone().view(-1, 1)
+        with torch.enable_grad():
+            output = self.head(fmap)
+            # Samples are independent in eval mode, so summing the selected logits
+            # gives every sample the gradient of its own class.
+            score = output.gather(1, index).sum()
+            grads, = torch.autograd.grad(score, fmap)
+
+        weights = grads.mean(dim=(2, 3), keepdim=True)
+        return torch.relu((weights * fmap.detach()).sum(dim=1)).cpu().numpy()
+
+    def remove(self):
+        """Uninstalls the forward hook."""
+        self._handle.remove()
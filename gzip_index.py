@@ -0,0 +1,77 @@
+import os
+import nibabel as nib
+from nibabel.fileholders import FileHolder
+from caching import file_digest, DiskCache
+
+class GzipIndexStore:
+    """
+    Random access into .nii.gz files via indexed_gzip (optional dependency).
+
+    A gzip stream can normally only be read from the start, so getting the
+    middle slice means decompressing everything before it. indexed_gzip keeps
+    seek points (decompressor snapshots every `spacing` bytes). The first time a
+    file is seen, seek points are recorded while the caller reads (so a full read,
+    e.g. for slice scoring, decompresses the stream once, not twice); the index
+    is completed on close and exported to a sidecar file keyed by the file's
+    SHA-256, then imported on every later read, so a slice read only
+    decompresses from the nearest seek point.
+
+    Without indexed_gzip installed, or without a directory to persist indexes in
+    (an index only pays off across reads), open() returns None and callers fall
+    back to nib.load.
+    """
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024, spacing=1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.spacing = spacing
+        self._disk = None
+
+    def _disk_cache(self):
+        # Created lazily so a missing indexed_gzip never creates the cache directory
+        if self._disk is None:
+            self._disk = DiskCache(self.directory, self.max_bytes, '.gzidx')
+        return self._disk
+
+    def open(self, path):
+        """
+        Returns: (nibabel image reading through a seekable IndexedGzipFile, a
+        function to call once done reading), or None if indexed_gzip is missing.
+        """
+        if self.directory is None: return None
+        try:
+            import indexed_gzip
+        except ImportError:
+            return None
+
+        disk = self._disk_cache()
+        key = file_digest(path)
+        gz = indexed_gzip.IndexedGzipFile(path, spacing=self.spacing)
+        try:
+            index_path = disk.get(key)
+            if index_path is not None:
+                try:
+                    gz.import_index(index_path)
+                except Exception as e:
+                    print(f"⚠️ Ignoring unreadable gzip index {index_path}: {e}")
+                    index_path = None
+                    gz.close()
+                    gz = indexed_gzip.IndexedGzipFile(path, spacing=self.spacing)
+
+            close = gz.close
+            if index_path is None:
+                # First read of this file: the caller's reads record seek points as they
+                # go; close() finishes the index (from the last seek point) and saves it
+                def close():
+                    try:
+                        gz.build_full_index()
+                        disk.put(key, lambda tmp_path: gz.export_index(tmp_path))
+                    except Exception as e:
+                        print(f"⚠️ Could not write gzip index: {e}")
+                    finally:
+                        gz.close()
+
+            file_map = {'image': FileHolder(filename=path, fileobj=gz)}
+            return nib.Nifti1Image.from_file_map(file_map), close
+        except Exception:
+            gz.close()
+            raise
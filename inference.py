@@ -2,42 +2,259 @@ import torch
 import torch.nn as nn
 from torchvision import models
 import os
+import hashlib
+import time
+from contextlib import contextmanager
 import numpy as np
 import cv2
 from PIL import Image
-from preprocessing import Preprocessor
+from preprocessing import Preprocessor, PREPROCESSING_VERSION, is_nifti
+from gradcam import GradCAM
+from backends import load_backend, optimize_model
+from caching import CACHE_DIR, file_digest, LRUCache, DiskCache
+from profiling import StageTimer, span, torch_trace
+from pipeline import PrefetchPipeline
+
+# Pre-stripped copy of a checkpoint (see export_model.py --format stripped)
+STRIPPED_SUFFIX = '.stripped.pth'
+
+# Persistent tier of the prediction cache
+PREDICTION_CACHE_DIR = os.path.join(CACHE_DIR, "predictions")
+
+def stripped_checkpoint_path(model_path):
+    return os.path.splitext(model_path)[0] + STRIPPED_SUFFIX
+
+def strip_dataparallel_prefix(state_dict):
+    """Fix DataParallel keys ('module.layer1...' -> 'layer1...')."""
+    new_state_dict = {}
+    for k, v in state_dict.items():
+        if k.startswith('module.'):
+            new_state_dict[k[7:]] = v
+        else:
+            new_state_dict[k] = v
+    return new_state_dict
+
+class Prediction:
+    """
+    Result handle returned by AlzheimerPredictor.predict.
+    Holds the label/confidence plus the cached layer4 activations (or an already
+    computed CAM), so the Grad-CAM overlay is only built if someone asks for it.
+    Predictions served from the PredictionCache without a CAM recompute the
+    activations from their scan on first access; the CAM is then written back
+    to the cache entry.
+    """
+    def __init__(self, predictor, class_name, confidence, class_idx=None, image=None, activations=None, cam=None):
+        self.class_name = class_name
+        self.confidence = confidence
+        self._predictor = predictor
+        self._class_idx = class_idx
+        self.image = image # uint8 (224, 224, 3): what the model saw
+        self._activations = activations
+        self._cam = cam # (7, 7) Grad-CAM before upsampling
+        self._source = None # Scan path to recompute the activations from (cache hit without a CAM)
+        self._cache_key = None # PredictionCache entry to complete once the CAM exists
+        self.agreement = None # TTA only: % of variants agreeing with class_name
+        self.uncertainty = None # TTA only: std of the class probability across variants (%)
+        self._original_pil = None
+        self._overlay_pil = None
+        self.timer = StageTimer() # Per-stage timing spans of this request (see .timings)
+
+    @property
+    def timings(self):
+        """[{"stage": "preprocess.skull_strip", "ms": 812.4}, ...] in start order."""
+        return self.timer.spans
+
+    def original(self):
+        """Returns the preprocessed image the model saw (PIL), or None on error."""
+        if self.image is None: return None
+        if self._original_pil is None:
+            self._original_pil = Image.fromarray(self.image)
+        return self._original_pil
+
+    def cam(self):
+        """Returns the compact (7, 7) Grad-CAM, computing it on first access."""
+        if self._cam is None and self._activations is None and self._source is not None:
+            with self.timer.activate(), span("recompute_activations"):
+                self._activations = self._predictor._activations(self._source)
+            self._source = None
+        if self._cam is None and self._activations is not None:
+            with self.timer.activate(), span("gradcam_backward"):
+                self._cam = self._predictor.gradcam.compute(self._activations, self._class_idx)[0]
+            # The activations are no longer needed once the CAM exists
+            self._activations = None
+            if self._cache_key is not None:
+                with self.timer.activate(), span("cache_store"):
+                    self._predictor.cache.put(self._cache_key, int(self._class_idx[0]), self.confidence,
+                                              self._cam, self.image)
+                self._cache_key = None
+        return self._cam
+
+    def heatmap(self):
+        """Returns the Grad-CAM overlay (PIL), computing it on first access."""
+        if self.image is None: return None
+        if self._overlay_pil is None:
+            cam = self.cam()
+            with self.timer.activate(), span("overlay"):
+                self._overlay_pil = self._predictor._render_overlay(self.image, cam)
+        return self._overlay_pil
+
+class VolumePrediction(Prediction):
+    """
+    Prediction for a multi-slice NIfTI slab (AlzheimerPredictor.predict_volume).
+    The heatmap/original are those of the representative slice, i.e. the slice
+    that is most confident about the aggregated class.
+    """
+    def __init__(self, predictor, class_name, confidence, slice_indices, slice_probabilities,
+                 representative_slice, **kwargs):
+        super().__init__(predictor, class_name, confidence, **kwargs)
+        self.slice_indices = slice_indices # Axial indices in the volume
+        self.slice_probabilities = slice_probabilities # (N, 4) softmax scores per slice
+        self.representative_slice = representative_slice # Axial index shown in the heatmap
+
+class PredictionCache:
+    """
+    Content-addressed prediction cache.
+    Key = SHA-256 of the scan file + fingerprint of the model weights (and backend)
+    + PREPROCESSING_VERSION + preprocessing variant (slice selection, HD-BET install;
+    see Preprocessor.variant), so entries invalidate automatically when the
+    checkpoint or the preprocessing changes.
+    Tiers: a bounded in-memory LRU in front of compressed .npz files on disk,
+    each storing the class, confidence and preprocessed image, plus the compact
+    CAM once someone asked for it (see Prediction.cam).
+    """
+    def __init__(self, model_path, backend_name, directory=PREDICTION_CACHE_DIR,
+                 max_entries=256, max_disk_bytes=512 * 1024 * 1024):
+        self.model_path = model_path
+        self.backend_name = backend_name
+        self.memory = LRUCache(max_entries)
+        self.disk = DiskCache(directory, max_disk_bytes, '.npz')
+        self._fingerprint = None
+
+    def fingerprint(self):
+        # Hashed on first use so it doesn't slow down model loading
+        if self._fingerprint is None:
+            self._fingerprint = f"{file_digest(self.model_path)}:{self.backend_name}"
+        return self._fingerprint
+
+    def key(self, image_path, variant=""):
+        raw = f"{file_digest(image_path)}:{self.fingerprint()}:{PREPROCESSING_VERSION}:{variant}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key):
+        """Returns (class_idx, confidence, cam or None, image) or None."""
+        entry = self.memory.get(key)
+        if entry is not None: return entry
+
+        path = self.disk.get(key)
+        if path is None: return None
+        try:
+            with np.load(path) as data:
+                cam = data['cam'] if 'cam' in data.files else None
+                entry = (int(data['class_idx']), float(data['confidence']), cam, data['image'])
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable cache entry {path}: {e}")
+            return None
+        self.memory.put(key, entry)
+        return entry
+
+    def put(self, key, class_idx, confidence, cam, image):
+        entry = (class_idx, confidence, cam, image)
+        self.memory.put(key, entry)
+
+        arrays = {"class_idx": class_idx, "confidence": confidence, "image": image}
+        if cam is not None: arrays["cam"] = cam
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+        try:
+            self.disk.put(key, write)
+        except OSError as e:
+            print(f"⚠️ Could not write prediction cache: {e}")
 
 class AlzheimerPredictor:
-    def __init__(self, model_path):
+    def __init__(self, model_path, backend="eager", optimize=False, compile_mode=None, cache=False, model=None,
+                 profile_dir=None, cache_dir=CACHE_DIR):
+        """
+        backend:      eager / torchscript / onnxruntime / int8
+        optimize:     inference-optimized eager build (conv-BN folding + channels_last)
+        compile_mode: None / "inductor" (torch.compile) / "onednn" (eager backend only)
+        cache:        keep derived data on disk under cache_dir and reuse it: predictions of
+                      already seen scans (see PredictionCache), HD-BET brain masks,
+                      .nii.gz seek indexes and slice choices (see Preprocessor); all
+                      size-bounded. Off = nothing is written to disk (in-memory caches
+                      only). The unbounded tensor_store.TensorStore is not part of it:
+                      batch runs opt in via preprocessor.tensor_store
+        model:        an already loaded model (see load_model), e.g. one whose weights live
+                      in shared memory across worker processes; model_path is not re-read
+        profile_dir:  write a torch.profiler trace (Chrome JSON) per request into this directory
+        cache_dir:    root directory of the caches enabled by `cache`
+        """
         self.device = torch.device("cpu") # Keep CPU for Mac stability
-        print(f"🧠 Loading Model on: {self.device}")
+        self.model_path = model_path
         
         self.class_names = ['Mild Demented', 'Moderate Demented', 'Non Demented', 'Very Mild Demented']
-        self.model = self._build_model()
-        
-        if os.path.exists(model_path):
-            state_dict = torch.load(model_path, map_location=self.device)
-            # Fix DataParallel keys
-            new_state_dict = {}
-            for k, v in state_dict.items():
-                if k.startswith('module.'):
-                    new_state_dict[k[7:]] = v
-                else:
-                    new_state_dict[k] = v
-            self.model.load_state_dict(new_state_dict)
-            self.model.eval()
-            self.model.to(self.device)
-            print("✅ Model Weights Loaded.")
-        else:
+        self.model = model if model is not None else self.load_model(model_path, optimize, self.device)
+
+        self.preprocessor = Preprocessor(cache_dir=cache_dir if cache else None)
+
+        # Grad-CAM engine: hook on the last convolutional layer (layer4) installed once
+        self.gradcam = GradCAM(self.model, self.model.layer4[-1], self._forward_head)
+
+        # Classification backend: eager / torchscript / onnxruntime (see export_model.py)
+        # or int8 (see quantize_model.py)
+        # The eager head above is always kept, Grad-CAM back-propagates through it.
+        self.backend = load_backend(backend, self.model, self.gradcam, model_path, self.device,
+                                    channels_last=optimize, compile_mode=compile_mode)
+        print(f"⚙️ Inference backend: {self.backend.name}")
+
+        self.cache = PredictionCache(model_path, self.backend.name,
+                                     directory=os.path.join(cache_dir, "predictions")) if cache else None
+
+        self.profile_dir = profile_dir
+        if profile_dir: os.makedirs(profile_dir, exist_ok=True)
+
+    @classmethod
+    def load_model(cls, model_path, optimize=False, device=torch.device("cpu")):
+        """
+        Builds the network and loads the trained weights (eval mode).
+        The returned model has no Grad-CAM hook yet, so it can be pickled/shared.
+        """
+        print(f"🧠 Loading Model on: {device}")
+        if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model not found at {model_path}")
 
-        self.preprocessor = Preprocessor()
+        # 1. Build the architecture on the meta device (no allocation, no random init)
+        with torch.device("meta"):
+            model = cls._build_model()
 
-        # Variables for Grad-CAM hooks
-        self.gradients = None
-        self.activations = None
+        # 2. Memory-mapped weights are assigned directly to the module (zero-copy)
+        model.load_state_dict(cls._load_state_dict(model_path, device), assign=True)
+        model.eval()
+        model.to(device)
+        if optimize:
+            optimize_model(model)
+        print("✅ Model Weights Loaded.")
+        return model
+
+    @staticmethod
+    def _load_state_dict(model_path, device):
+        """
+        Loads the checkpoint with memory-mapped tensors. Uses the pre-stripped
+        checkpoint when it is up to date, so no key rewriting is needed.
+        """
+        stripped_path = stripped_checkpoint_path(model_path)
+        if os.path.exists(stripped_path) and os.path.getmtime(stripped_path) >= os.path.getmtime(model_path):
+            return torch.load(stripped_path, map_location=device, mmap=True, weights_only=True)
+
+        try:
+            state_dict = torch.load(model_path, map_location=device, mmap=True, weights_only=True)
+        except RuntimeError:
+            # Legacy (non-zipfile) checkpoints can't be memory-mapped
+            state_dict = torch.load(model_path, map_location=device)
+        return strip_dataparallel_prefix(state_dict)
 
-    def _build_model(self):
+    @staticmethod
+    def _build_model():
         model = models.resnet50(weights=None)
         num_ftrs = model.fc.in_features
         model.fc = nn.Sequential(
@@ -48,70 +265,294 @@ class AlzheimerPredictor:
         )
         return model
 
-    # --- HOOKS FOR GRAD-CAM ---
-    def hook_backward(self, module, grad_input, grad_output):
-        self.gradients = grad_output[0]
+    def _forward_head(self, fmap):
+        """Classifier head on top of the layer4 feature map. Returns logits."""
+        return self.model.fc(torch.flatten(self.model.avgpool(fmap), 1))
+
+    def _forward(self, batch):
+        """
+        Forward pass on a preprocessed (N, 3, 224, 224) batch without autograd.
+        Returns: softmax probabilities and the layer4 activations.
+        """
+        output, fmap = self.backend(batch)
+        with torch.inference_mode():
+            probabilities = torch.nn.functional.softmax(output, dim=1)
+        return probabilities, fmap
+
+    def _classify(self, batch):
+        """
+        Returns: confidences, predicted class indices and the layer4 activations.
+        """
+        probabilities, fmap = self._forward(batch)
+        confidence, predicted_idx = torch.max(probabilities, 1)
+        return confidence, predicted_idx, fmap
+
+    @contextmanager
+    def _instrumented(self, image_path):
+        """
+        Times one request: yields the StageTimer that span() calls record into,
+        inside a torch.profiler trace when profile_dir is set.
+        """
+        trace_path = None
+        if self.profile_dir:
+            name = os.path.basename(image_path).replace('.', '_')
+            trace_path = os.path.join(self.profile_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+        timer = StageTimer()
+        with torch_trace(trace_path), timer.activate():
+            yield timer
+
+    def predict(self, image_path):
+        """
+        Fast prediction path: no autograd graph and no backward pass.
+        Returns: A Prediction handle. Call .heatmap() on it to get the Grad-CAM
+        overlay later (computed from the cached layer4 activations).
+        Per-stage timings are in result.timings.
+        """
+        with self._instrumented(image_path) as timer:
+            result = self._predict(image_path, timer)
+        result.timer = timer
+        return result
+
+    def _predict(self, image_path, timer):
+        # 1. Cache lookup (same file content + same model + same preprocessing)
+        cache_key = None
+        if self.cache is not None:
+            with span("cache_lookup"):
+                cache_key = self.cache.key(image_path, self.preprocessor.variant(image_path))
+                entry = self.cache.get(cache_key)
+            if entry is not None:
+                class_idx, confidence, cam, image = entry
+                result = Prediction(self, self.class_names[class_idx], confidence,
+                                    class_idx=torch.tensor([class_idx]), image=image, cam=cam)
+                if cam is None:
+                    # Stored before anyone asked for its heatmap: .cam() recomputes it once
+                    result._source, result._cache_key = image_path, cache_key
+                return result
+
+        # 2. Preprocess
+        with span("preprocess"):
+            planes, complete = self.preprocessor.load_planes_with_status(image_path)
+        if planes is None: return Prediction(self, "Error", 0.0)
+
+        # 3. Forward Pass
+        result = self.predict_planes([planes])[0]
+        result.timer = timer
+
+        # 4. Store without the CAM (Grad-CAM stays on demand); .cam() adds it to the entry.
+        #    A volume used unstripped after an HD-BET failure is not cached: the next
+        #    upload of that scan gets another chance at skull stripping.
+        if cache_key is not None and complete:
+            with span("cache_store"):
+                self.cache.put(cache_key, self.class_names.index(result.class_name), result.confidence,
+                               None, result.image)
+            result._cache_key = cache_key
+        return result
+
+    def _activations(self, image_path):
+        """Layer4 activations of a scan, for a cached Prediction whose CAM was never computed."""
+        tensor = self.preprocessor.load_and_preprocess(image_path)
+        if tensor is None: return None
+        _, fmap = self._forward(tensor.to(self.device))
+        return fmap
+
+    def predict_tensors(self, tensors):
+        """
+        Classifies already preprocessed (1, 3, 224, 224) tensors in ONE forward pass.
+        Returns: A list of Prediction handles (Grad-CAM on demand), in the same order.
+        """
+        return self._predict_batch(torch.cat(tensors))
+
+    def predict_planes(self, planes_list):
+        """
+        Classifies scans given as uint8 planes (Preprocessor.load_planes, e.g. from a
+        PrefetchPipeline) in ONE forward pass: the planes are normalized straight
+        into a single preallocated (N, 3, 224, 224) batch.
+        Returns: A list of Prediction handles (Grad-CAM on demand), in the same order.
+        """
+        with span("batch"):
+            batch = self.preprocessor.batch_from_planes(planes_list)
+        return self._predict_batch(batch)
+
+    def _predict_batch(self, batch):
+        batch = batch.to(self.device)
+        with span("forward"):
+            confidence, predicted_idx, fmap = self._classify(batch)
+        with span("denormalize"):
+            return [Prediction(self, self.class_names[predicted_idx[i].item()], confidence[i].item() * 100,
+                               class_idx=predicted_idx[i:i + 1], image=self._denormalize(batch[i]),
+                               activations=fmap[i:i + 1])
+                    for i in range(batch.shape[0])]
+
+    def predict_tta(self, image_path, num_variants=8):
+        """
+        Test-time augmentation: all `num_variants` variants (flips, small rotations,
+        intensity jitter) of the preprocessed tensor are classified in ONE batched
+        forward pass and their softmax scores are averaged.
+        Returns: A Prediction with .agreement and .uncertainty set next to the confidence.
+        """
+        with self._instrumented(image_path) as timer:
+            result = self._predict_tta(image_path, num_variants)
+        result.timer = timer
+        return result
+
+    def _predict_tta(self, image_path, num_variants):
+        # 1. Preprocess once, augment as a batch
+        with span("preprocess"):
+            tensor = self.preprocessor.load_and_preprocess(image_path)
+        if tensor is None: return Prediction(self, "Error", 0.0)
+        with span("augment"):
+            variants = self.preprocessor.augment(tensor, num_variants)
+
+        # 2. One forward pass for all variants
+        with span("forward"):
+            probabilities, fmap = self._forward(variants.to(self.device))
+        mean_probs = probabilities.mean(dim=0)
+        class_idx = int(torch.argmax(mean_probs))
+
+        # 3. Heatmap of the un-augmented variant (0), for the averaged class
+        result = Prediction(self, self.class_names[class_idx], mean_probs[class_idx].item() * 100,
+                            class_idx=torch.tensor([class_idx]),
+                            image=self._denormalize(tensor[0]), activations=fmap[0:1])
+
+        # 4. Spread between variants as an uncertainty score
+        result.agreement = (probabilities.argmax(dim=1) == class_idx).float().mean().item() * 100
+        result.uncertainty = probabilities[:, class_idx].std(unbiased=False).item() * 100
+        return result
+
+    def predict_volume(self, image_path, num_slices=20, aggregate="mean"):
+        """
+        Multi-slice NIfTI mode: a slab of `num_slices` axial slices is classified
+        in ONE batched forward pass and the per-slice probabilities are aggregated.
+        aggregate: "mean" (mean probability), "max" (per-class max, renormalized)
+                   or "vote" (majority of per-slice predictions).
+        Returns: A VolumePrediction (2D images fall back to predict()).
+        """
+        if not is_nifti(image_path):
+            return self.predict(image_path)
+
+        with self._instrumented(image_path) as timer:
+            result = self._predict_volume(image_path, num_slices, aggregate)
+        result.timer = timer
+        return result
+
+    def _predict_volume(self, image_path, num_slices, aggregate):
+        # 1. Preprocess the slab (one vectorized pass)
+        with span("preprocess"):
+            tensor, indices = self.preprocessor.load_volume_slab(image_path, num_slices)
+        if tensor is None: return Prediction(self, "Error", 0.0)
+
+        # 2. One forward pass for all slices
+        with span("forward"):
+            probabilities, fmap = self._forward(tensor.to(self.device))
+        slice_probs = probabilities.numpy()
+
+        # 3. Aggregate
+        if aggregate == "mean":
+            scores = slice_probs.mean(axis=0)
+        elif aggregate == "max":
+            scores = slice_probs.max(axis=0)
+            scores = scores / scores.sum()
+        elif aggregate == "vote":
+            votes = np.bincount(slice_probs.argmax(axis=1), minlength=len(self.class_names))
+            # Ties are broken by the mean probability
+            scores = votes / votes.sum() + 1e-6 * slice_probs.mean(axis=0)
+        else:
+            raise ValueError(f"Unknown aggregation: {aggregate}")
+        class_idx = int(np.argmax(scores))
 
-    def hook_forward(self, module, input, output):
-        self.activations = output
+        # 4. Representative slice for the heatmap: most confident about the final class
+        rep = int(np.argmax(slice_probs[:, class_idx]))
+        return VolumePrediction(self, self.class_names[class_idx], float(scores[class_idx]) * 100,
+                                slice_indices=indices, slice_probabilities=slice_probs,
+                                representative_slice=indices[rep],
+                                class_idx=torch.tensor([class_idx]),
+                                image=self._denormalize(tensor[rep]),
+                                activations=fmap[rep:rep + 1])
 
     def predict_with_heatmap(self, image_path):
         """
         Returns: Prediction, Confidence, Overlay Image, and Original Image
+        (use predict() + .heatmap() to also get the per-stage .timings)
         """
-        # 1. Preprocess
-        tensor = self.preprocessor.load_and_preprocess(image_path)
-        if tensor is None: return "Error", 0.0, None, None
+        with self._instrumented(image_path) as timer:
+            result = self._predict(image_path, timer)
+            result.timer = timer
+            overlay = result.heatmap()
+        return result.class_name, result.confidence, overlay, result.original()
 
-        tensor = tensor.to(self.device)
+    def predict_batch(self, image_paths, batch_size=16, prefetch=32, workers=4):
+        """
+        Batched version of predict_with_heatmap for scoring many scans at once.
+        Scans are stacked into (N, 3, 224, 224) batches so every batch costs one
+        forward and one (head-only) backward pass instead of one per scan.
+        Upcoming scans are preprocessed in the background (up to `prefetch` ahead,
+        see pipeline.PrefetchPipeline) while the model runs the current batch.
+        Returns: A list of (Prediction, Confidence, Overlay Image, Original Image)
+        tuples in the same order as image_paths.
+        """
+        # Failed scans keep an "Error" slot
+        results = [("Error", 0.0, None, None)] * len(image_paths)
+        loaded_idx, planes_list = [], []
 
-        # 2. Register Hooks on the last convolutional layer (layer4)
-        target_layer = self.model.layer4[-1]
-        handle_b = target_layer.register_full_backward_hook(self.hook_backward)
-        handle_f = target_layer.register_forward_hook(self.hook_forward)
+        def flush():
+            # One batch tensor, one forward/backward pass for the whole batch
+            batch = self.preprocessor.batch_from_planes(planes_list).to(self.device)
+            for i, result in zip(loaded_idx, self._predict_tensor_batch(batch)):
+                results[i] = result
+            loaded_idx.clear()
+            planes_list.clear()
 
-        # 3. Forward Pass
-        self.model.zero_grad()
-        output = self.model(tensor)
-        probabilities = torch.nn.functional.softmax(output, dim=1)
-        confidence, predicted_idx = torch.max(probabilities, 1)
+        with PrefetchPipeline(self.preprocessor, depth=prefetch, workers=workers) as pipeline:
+            for i, (path, planes, error) in enumerate(pipeline.map(image_paths)):
+                if planes is None:
+                    print(f"Skipping {path}: {error}")
+                    continue
+                loaded_idx.append(i)
+                planes_list.append(planes)
+                if len(planes_list) >= batch_size: flush()
+        if planes_list: flush()
+        return results
 
-        # 4. Backward Pass (to get gradients)
-        output[0, predicted_idx].backward()
+    def _predict_tensor_batch(self, batch):
+        """
+        Runs classification + Grad-CAM on an already preprocessed (N, 3, 224, 224) batch.
+        Each sample gets the CAM of its own predicted class.
+        """
+        # 1. Forward Pass (no autograd graph through the backbone)
+        confidence, predicted_idx, fmap = self._classify(batch)
 
-        # 5. Generate Heatmap
-        grads = self.gradients.cpu().data.numpy()[0]
-        fmap = self.activations.cpu().data.numpy()[0]
-        weights = np.mean(grads, axis=(1, 2))
+        # 2. Generate Heatmaps (head-only backward, vectorized over the batch)
+        cams = self.gradcam.compute(fmap, predicted_idx)
 
-        cam = np.zeros(fmap.shape[1:], dtype=np.float32)
-        for i, w in enumerate(weights):
-            cam += w * fmap[i]
-        
-        cam = np.maximum(cam, 0)
-        cam = cv2.resize(cam, (224, 224))
-        cam = (cam - np.min(cam)) / (np.max(cam) + 1e-8)
+        results = []
+        for i in range(batch.shape[0]):
+            orig_img = self._denormalize(batch[i])
+            results.append((self.class_names[predicted_idx[i].item()], confidence[i].item() * 100,
+                            self._render_overlay(orig_img, cams[i]), Image.fromarray(orig_img)))
+        return results
 
-        # 6. Get original image (denormalized from tensor)
-        # This is what the model actually saw after preprocessing
-        orig_img = tensor.squeeze().permute(1, 2, 0).cpu().numpy()
-        # Denormalize
+    def _denormalize(self, tensor):
+        """
+        Converts a single preprocessed (3, 224, 224) tensor back to a uint8 RGB image.
+        This is what the model actually saw after preprocessing.
+        """
+        orig_img = tensor.permute(1, 2, 0).cpu().numpy()
         orig_img = orig_img * np.array([0.229, 0.224, 0.225]) + np.array([0.485, 0.456, 0.406])
         orig_img = np.clip(orig_img, 0, 1)
-        orig_img = (orig_img * 255).astype(np.uint8)
-        
-        # Convert to PIL for consistency
-        original_pil = Image.fromarray(orig_img)
+        return (orig_img * 255).astype(np.uint8)
 
-        # 7. Create Overlay Image (blend original with heatmap)
+    def _render_overlay(self, orig_img, cam):
+        """
+        Blends a (7, 7) Grad-CAM map onto the uint8 (224, 224, 3) preprocessed image.
+        Returns: Overlay Image (PIL)
+        """
+        cam = cv2.resize(cam.astype(np.float32), (224, 224))
+        cam = (cam - np.min(cam)) / (np.max(cam) + 1e-8)
+
+        # Create Overlay Image (blend original with heatmap)
         heatmap_colored = cv2.applyColorMap(np.uint8(255 * cam), cv2.COLORMAP_JET)
         heatmap_colored = cv2.cvtColor(heatmap_colored, cv2.COLOR_BGR2RGB)
         
         overlay = cv2.addWeighted(orig_img, 0.6, heatmap_colored, 0.4, 0)
-        overlay_pil = Image.fromarray(overlay)
-
-        # Cleanup
-        handle_b.remove()
-        handle_f.remove()
-
-        return self.class_names[predicted_idx.item()], confidence.item() * 100, overlay_pil, original_pil
\ No newline at end of file
+        return Image.fromarray(overlay)
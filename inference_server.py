@@ -0,0 +1,255 @@
+"""
+Headless inference service: lets several reading-room stations share one CPU
+inference box.
+
+Concurrent requests are preprocessed in a thread pool and then grouped into
+micro-batches (up to --max-batch-size scans, waiting at most --max-wait-ms for
+the batch to fill), so the model runs one forward pass per batch instead of
+competing threads each running their own.
+
+Backpressure: at most --max-pending requests are accepted at a time; beyond
+that the service answers 503 (with Retry-After) instead of queueing forever.
+Every request also has a --timeout after which it answers 504; a request whose
+preprocessing is still running at that point stays counted until it finishes.
+
+Endpoints:
+    POST /predict?filename=scan.nii.gz[&heatmap=1]   body = raw scan file
+    GET  /health                                      (includes per-stage latency histograms)
+
+Usage:
+    python inference_server.py --model models/alzheimer_resnet50_best.pth --port 8080
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from inference import AlzheimerPredictor
+from profiling import StageTimer, span, STAGE_HISTOGRAMS
+
+# --- CONFIGURATION ---
+DEFAULT_MODEL_PATH = "models/alzheimer_resnet50_best.pth"
+SUPPORTED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.nii', '.nii.gz')
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+
+class ServiceOverloaded(Exception):
+    """Raised when the request queue is full (answered with 503)."""
+
+class MicroBatcher:
+    """
+    Groups concurrent single-scan requests into batches for the predictor.
+    A batch is dispatched as soon as it holds max_batch_size scans or when
+    max_wait_ms have passed since its first request arrived.
+    """
+    def __init__(self, predictor, max_batch_size=16, max_wait_ms=10, max_queue=64):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.queue = None # Created by start(), on the server's event loop
+        # A single model thread: batches run one after the other, each using all intra-op threads
+        self.model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self.batches = 0
+        self.batched_items = 0
+
+    def start(self):
+        """
+        Creates the queue and schedules run() on the running loop. The queue must
+        not be built earlier: before Python 3.10 it binds to the loop current at
+        construction, not the one web.run_app starts.
+        Returns: the batcher task.
+        """
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        return asyncio.create_task(self.run())
+
+    async def submit(self, planes):
+        """Queues one scan's preprocessed uint8 planes. Returns its Prediction."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((planes, future))
+        except asyncio.QueueFull:
+            raise ServiceOverloaded()
+        return await future
+
+    def _predict_batch(self, planes_list):
+        """Runs in the model thread. Every result gets the batch's forward timing."""
+        timer = StageTimer()
+        with timer.activate():
+            results = self.predictor.predict_planes(planes_list)
+        for result in results:
+            result.timer.spans.extend(dict(s) for s in timer.spans)
+        return results
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # 1. Wait for the first request, then collect more until full or timed out
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(items) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0: break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # 2. Requests that timed out while waiting are dropped before the forward pass
+            items = [(planes, future) for planes, future in items if not future.done()]
+            if not items: continue
+
+            # 3. One forward pass for the whole batch (off the event loop)
+            try:
+                results = await loop.run_in_executor(
+                    self.model_executor, self._predict_batch, [p for p, _ in items])
+            except Exception as e:
+                for _, future in items:
+                    if not future.done(): future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.batched_items += len(items)
+            for (_, future), result in zip(items, results):
+                if not future.done(): future.set_result(result)
+
+class InferenceService:
+    def __init__(self, predictor, max_batch_size, max_wait_ms, max_pending, timeout, preprocess_workers):
+        self.predictor = predictor
+        self.batcher = MicroBatcher(predictor, max_batch_size, max_wait_ms, max_queue=max_pending)
+        self.preprocess_executor = ThreadPoolExecutor(max_workers=preprocess_workers, thread_name_prefix="preprocess")
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+
+    def _preprocess(self, data, suffix, timer):
+        # The preprocessor dispatches on the file extension, so keep it on the temp file
+        tf = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+        try:
+            tf.write(data)
+            tf.close()
+            with timer.activate(), span("preprocess"):
+                return self.predictor.preprocessor.load_planes(tf.name)
+        finally:
+            try:
+                os.remove(tf.name)
+            except OSError: pass
+
+    def _encode_heatmap(self, result):
+        buf = io.BytesIO()
+        result.heatmap().save(buf, format='PNG')
+        return base64.b64encode(buf.getvalue()).decode('ascii')
+
+    async def handle_predict(self, request):
+        filename = request.query.get("filename", "")
+        suffix = next((ext for ext in SUPPORTED_EXTENSIONS if filename.lower().endswith(ext)), None)
+        if suffix is None:
+            return web.json_response({"error": f"filename must end with one of {SUPPORTED_EXTENSIONS}"}, status=400)
+
+        # Backpressure: refuse early instead of piling up uploads in memory
+        if self.pending >= self.max_pending:
+            return web.json_response({"error": "Server busy"}, status=503, headers={"Retry-After": "1"})
+
+        self.pending += 1
+        jobs = [] # Executor jobs of this request (see _run_job)
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(self._predict(request, suffix, jobs), self.timeout)
+        except asyncio.TimeoutError:
+            return web.json_response({"error": f"Timed out after {self.timeout}s"}, status=504)
+        except ServiceOverloaded:
+            return web.json_response({"error": "Server busy"}, status=503, headers={"Retry-After": "1"})
+        finally:
+            self._release_when_done(jobs)
+            print(f"POST /predict {filename} ({1000 * (time.perf_counter() - start):.0f} ms)")
+
+    def _release_when_done(self, jobs):
+        """
+        Frees the request's pending slot once none of its executor jobs can still run.
+        After a timeout, queued jobs are cancelled, but a job already running (e.g. a
+        slow HD-BET scan holding the upload) keeps the slot until it finishes, so
+        abandoned work still counts against --max-pending.
+        """
+        loop = asyncio.get_running_loop()
+        running = [job for job in jobs if not job.cancel() and not job.done()]
+        if not running:
+            self.pending -= 1
+            return
+
+        remaining = [len(running)]
+        def finished():
+            remaining[0] -= 1
+            if remaining[0] == 0: self.pending -= 1
+        for job in running:
+            job.add_done_callback(lambda _: loop.call_soon_threadsafe(finished))
+
+    async def _run_job(self, jobs, fn, *args):
+        """Runs fn in the preprocessing pool, recording the job in `jobs`."""
+        job = self.preprocess_executor.submit(fn, *args)
+        jobs.append(job)
+        return await asyncio.wrap_future(job)
+
+    async def _predict(self, request, suffix, jobs):
+        data = await request.read()
+
+        timer = StageTimer()
+        planes = await self._run_job(jobs, self._preprocess, data, suffix, timer)
+        if planes is None:
+            return web.json_response({"error": "Could not preprocess scan"}, status=422)
+
+        result = await self.batcher.submit(planes)
+        response = {"prediction": result.class_name, "confidence": round(result.confidence, 2)}
+        if request.query.get("heatmap") in ("1", "true"):
+            response["heatmap_png"] = await self._run_job(jobs, self._encode_heatmap, result)
+        response["timings"] = timer.spans + result.timings
+        return web.json_response(response)
+
+    async def handle_health(self, request):
+        batches = self.batcher.batches
+        return web.json_response({
+            "status": "ok",
+            "backend": self.predictor.backend.name,
+            "pending": self.pending,
+            "batches": batches,
+            "mean_batch_size": round(self.batcher.batched_items / batches, 2) if batches else 0.0,
+            "stages": STAGE_HISTOGRAMS.snapshot(),
+        })
+
+    async def _start_batcher(self, app):
+        app["batcher_task"] = self.batcher.start()
+
+    async def _stop_batcher(self, app):
+        app["batcher_task"].cancel()
+
+    def build_app(self):
+        app = web.Application(client_max_size=MAX_UPLOAD_BYTES)
+        app.router.add_post("/predict", self.handle_predict)
+        app.router.add_get("/health", self.handle_health)
+        app.on_startup.append(self._start_batcher)
+        app.on_cleanup.append(self._stop_batcher)
+        return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Alzheimer MRI inference service")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--backend", default="eager", help="eager / torchscript / onnxruntime / int8")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0, help="Max time a batch waits to fill up")
+    parser.add_argument("--max-pending", type=int, default=64, help="Max in-flight requests before answering 503")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--preprocess-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    predictor = AlzheimerPredictor(args.model, backend=args.backend, optimize=args.backend == "eager")
+    service = InferenceService(predictor, args.max_batch_size, args.max_wait_ms, args.max_pending,
+                               args.timeout, args.preprocess_workers)
+    print(f"🚀 Serving on http://{args.host}:{args.port} (max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms)")
+    web.run_app(service.build_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
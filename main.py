@@ -11,6 +11,7 @@ import io
 # Local Imports
 from auth_manager import AuthManager
 from inference import AlzheimerPredictor
+from profiling import format_timings
 from database import init_db, Report, User
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
@@ -42,6 +43,7 @@ class MedicalApp(ctk.CTk):
         self.current_user = None
         self.predictor = None # Loaded lazily
         self.model_path = "models/alzheimer_resnet50_best.pth"
+        self.model_backend = "eager" # eager / torchscript / onnxruntime / int8 (see export_model.py, quantize_model.py)
         
         # Check if super admin setup is needed
         needs_setup = self.auth._ensure_superadmin()
@@ -480,8 +482,10 @@ class MedicalApp(ctk.CTk):
         self.current_scan_path = None
         self.current_prediction_text = None
         self.current_confidence_text = None
+        self.current_prediction = None # Predictor result handle (Grad-CAM on demand)
         self.current_overlay_pil = None # Heatmap
         self.current_original_pil = None # Clean
+        self.overlay_request = None # (prediction, callbacks) while its overlay is computed
 
     def setup_report_form(self):
         # Header
@@ -529,14 +533,59 @@ class MedicalApp(ctk.CTk):
         if not self.current_original_pil: return
         
         if self.heatmap_switch.get() == 1:
-            # Show Heatmap
-            self.update_display_image(self.current_overlay_pil)
+            # Show Heatmap (once computed)
+            self.with_overlay(self._show_overlay_if_selected)
         else:
             # Show Original
             self.update_display_image(self.current_original_pil)
 
+    def _show_overlay_if_selected(self, overlay):
+        if self.heatmap_switch.get() == 1:
+            self.update_display_image(overlay)
+
+    def get_current_overlay(self):
+        # Only returns an overlay that already exists: go through with_overlay() first
+        return self.current_overlay_pil
+
+    def with_overlay(self, callback):
+        """
+        Calls callback(overlay) on the main thread once the Grad-CAM overlay exists.
+        The first call computes it in a worker thread: for a cached prediction that
+        can mean a forward pass or even full preprocessing, which would freeze the UI.
+        """
+        prediction = self.current_prediction
+        if self.current_overlay_pil is not None or prediction is None:
+            callback(self.current_overlay_pil)
+            return
+        if self.overlay_request is not None and self.overlay_request[0] is prediction:
+            self.overlay_request[1].append(callback) # Already being computed
+            return
+
+        self.overlay_request = (prediction, [callback])
+        threading.Thread(target=self._overlay_thread, args=(prediction,), daemon=True).start()
+
+    def _overlay_thread(self, prediction):
+        try:
+            overlay = prediction.heatmap()
+            self.after(0, self._on_overlay_ready, prediction, overlay)
+        except Exception as e:
+            self.after(0, self._on_overlay_ready, prediction, None, False)
+            self.after(0, lambda: messagebox.showerror("Error", f"Heatmap failed: {e}"))
+
+    def _on_overlay_ready(self, prediction, overlay, succeeded=True):
+        callbacks = []
+        if self.overlay_request is not None and self.overlay_request[0] is prediction:
+            callbacks = self.overlay_request[1]
+            self.overlay_request = None
+        # Ignore results for a scan that was replaced meanwhile
+        if prediction is not self.current_prediction or not succeeded: return
+        self.current_overlay_pil = overlay
+        for callback in callbacks:
+            callback(overlay)
+
     def clear_scan(self):
         self.current_scan_path = None
+        self.current_prediction = None
         self.current_prediction_text = None
         self.current_original_pil = None
         self.current_overlay_pil = None
@@ -599,22 +648,26 @@ class MedicalApp(ctk.CTk):
         
     def _inference_thread(self, path):
         try:
-            # Heavy lifting here - now returns 4 values
-            pred_class, confidence, overlay_img, original_pil = self.predictor.predict_with_heatmap(path)
+            # Heavy lifting here - the heatmap is only computed when the user asks for it
+            result = self.predictor.predict(path)
+            print(f"⏱️ Stage timings for {os.path.basename(path)}:\n{format_timings(result.timings)}")
             
             # Schedule UI Update on Main Thread
-            self.after(0, self._on_inference_complete, pred_class, confidence, overlay_img, original_pil)
+            self.after(0, self._on_inference_complete, result)
             
         except Exception as e:
             self.after(0, lambda: messagebox.showerror("Error", f"Inference failed: {e}"))
             self.after(0, self._reset_scan_ui)
             
-    def _on_inference_complete(self, pred_class, confidence, overlay_img, original_pil):
+    def _on_inference_complete(self, result):
+        pred_class, confidence = result.class_name, result.confidence
+
         # Store State
+        self.current_prediction = result
         self.current_prediction_text = pred_class
         self.current_confidence_text = f"{confidence:.2f}%"
-        self.current_overlay_pil = overlay_img
-        self.current_original_pil = original_pil
+        self.current_overlay_pil = None
+        self.current_original_pil = result.original()
         
         # Update UI
         color = "#EF4444" if "Demented" in pred_class and "Non" not in pred_class else "#10B981"
@@ -728,7 +781,7 @@ class MedicalApp(ctk.CTk):
             temp_orig = "temp_pdf_orig.jpg"
             temp_heat = "temp_pdf_heat.jpg"
             self.current_original_pil.save(temp_orig)
-            self.current_overlay_pil.save(temp_heat)
+            self.get_current_overlay().save(temp_heat)
             
             img_y = y - 220
             c.drawImage(temp_orig, 50, img_y, width=200, height=200, preserveAspectRatio=True)
@@ -764,6 +817,10 @@ class MedicalApp(ctk.CTk):
         return entry
 
     def save_and_export(self):
+        # The overlay goes into the record and the PDF: compute it first, off the UI thread
+        self.with_overlay(lambda overlay: self._save_and_export())
+
+    def _save_and_export(self):
         # 1. Save to Database
         if self.save_report_db(silent=True):
             # 2. Export PDF
@@ -801,7 +858,7 @@ class MedicalApp(ctk.CTk):
                 confidence=self.current_confidence_text,
                 created_by_user_id=self.current_user.id,
                 original_image=img_to_bytes(self.current_original_pil),
-                heatmap_image=img_to_bytes(self.current_overlay_pil)
+                heatmap_image=img_to_bytes(self.get_current_overlay())
             )
             session.add(new_report)
             session.commit()
@@ -1115,8 +1172,10 @@ class MedicalApp(ctk.CTk):
 
     def _init_predictor(self):
         try:
-            self.predictor = AlzheimerPredictor(self.model_path)
+            self.predictor = AlzheimerPredictor(self.model_path, backend=self.model_backend, optimize=True, cache=True)
             print("Model Loaded")
+            # Load HD-BET now so the first NIfTI scan doesn't pay for it
+            self.predictor.preprocessor.skull_stripper.warm_up()
         except Exception as e:
             print(f"Model Error: {e}")
 
@@ -0,0 +1,88 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import torch
+from preprocessing import Preprocessor
+from tensor_store import TensorStore
+
+# Per-process Preprocessor of the "process" mode (built once per worker by the initializer)
+_process_preprocessor = None
+
+def _init_process_worker(threads, slice_selection, tensor_store_dir, cache_dir):
+    global _process_preprocessor
+    torch.set_num_threads(threads) # Leave the cores to the model
+    # Workers only read the tensor store (it allows one writing process); thread mode fills it
+    store = TensorStore(tensor_store_dir, read_only=True) if tensor_store_dir else None
+    _process_preprocessor = Preprocessor(slice_selection=slice_selection, tensor_store=store, cache_dir=cache_dir)
+
+def _preprocess(preprocessor, path):
+    """
+    Returns (uint8 (C, 224, 224) planes or None, error message or None); never raises.
+    Planes are 4-12x smaller than the float tensor, so a deep prefetch queue stays
+    cheap; consumers normalize them into their batch (Preprocessor.batch_from_planes).
+    """
+    try:
+        planes = preprocessor.load_planes(path)
+        return planes, None if planes is not None else "Could not preprocess scan"
+    except Exception as e:
+        return None, str(e)
+
+def _preprocess_in_process(path):
+    return _preprocess(_process_preprocessor, path)
+
+class PrefetchPipeline:
+    """
+    Streaming preprocessing stage: loads/decodes/skull-strips upcoming scans in a
+    bounded pool while the model works on the current ones.
+
+    - depth:   max scans preprocessed ahead of the consumer (backpressure: nothing
+               new is submitted until the consumer takes a result, so memory stays
+               bounded at `depth` scans of uint8 planes)
+    - workers: pool size
+    - mode:    "thread" (default; decoding/zlib/HD-BET release the GIL) or "process"
+               (one Preprocessor per worker process, for GIL-bound preprocessing)
+    Usage:
+        with PrefetchPipeline(predictor.preprocessor, depth=32, workers=4) as pipeline:
+            for path, planes, error in pipeline.map(paths):
+                ...
+    """
+    def __init__(self, preprocessor, depth=32, workers=4, mode="thread"):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown pipeline mode: {mode}")
+        self.preprocessor = preprocessor
+        self.depth = max(1, depth)
+        self.mode = mode
+        if mode == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        else:
+            store_dir = preprocessor.tensor_store.directory if preprocessor.tensor_store else None
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_init_process_worker,
+                                                initargs=(1, preprocessor.slice_selection, store_dir,
+                                                          preprocessor.cache_dir))
+
+    def _submit(self, path):
+        if self.mode == "thread":
+            return self.executor.submit(_preprocess, self.preprocessor, path)
+        return self.executor.submit(_preprocess_in_process, path)
+
+    def map(self, paths):
+        """Yields (path, planes or None, error or None) in input order."""
+        pending = deque()
+        for path in paths:
+            pending.append((path, self._submit(path)))
+            if len(pending) >= self.depth:
+                path, future = pending.popleft()
+                yield (path,) + future.result()
+        while pending:
+            path, future = pending.popleft()
+            yield (path,) + future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
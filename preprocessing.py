@@ -1,13 +1,74 @@
+import hashlib
+import json
 import os
+from contextlib import contextmanager
 import numpy as np
 import cv2
 import nibabel as nib
 from PIL import Image
 import torch
+import torch.nn.functional as F
 from torchvision import transforms
+from profiling import span
+from caching import file_digest, LRUCache, DiskCache
+from gzip_index import GzipIndexStore
+from skull_stripping import SkullStripper
+from slice_selection import SCORE_STRIDE, middle_slices, score_slices, select_slices
+
+# Bump whenever the output of load_and_preprocess changes for the same input
+# (invalidates cached predictions, see inference.PredictionCache)
+PREPROCESSING_VERSION = 5
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Model input size, and how much larger than it a JPEG must be before it is
+# decoded at reduced scale (JPEG draft mode keeps at least DRAFT_FACTOR x the target)
+INPUT_SIZE = 224
+DRAFT_FACTOR = 2
+
+
+def is_nifti(file_path):
+    """True for .nii and .nii.gz (splitext alone only sees '.gz')."""
+    return file_path.lower().endswith(('.nii', '.nii.gz'))
+
+def axial_layout(nii_img):
+    """
+    Resolves where the axial slices are from the NIfTI affine instead of assuming axis 0.
+    Returns: (axial axis, transpose in-plane axes, flip rows, flip columns) such that
+    every extracted slice has rows anterior -> posterior and columns patient
+    right -> left (radiological view), whatever the scanner's storage order.
+    Oblique scans use their closest axes. Volumes without a usable orientation
+    (qform_code = sform_code = 0, or a singular affine) keep the legacy layout:
+    axis 0, unchanged.
+    """
+    legacy = (0, False, False, False)
+    header = nii_img.header
+    try:
+        if int(header['qform_code']) == 0 and int(header['sform_code']) == 0:
+            return legacy
+    except (KeyError, ValueError, TypeError):
+        return legacy
+
+    codes = nib.aff2axcodes(nii_img.affine) # Direction each voxel axis increases towards
+    if None in codes: return legacy
+    si = next(axis for axis, code in enumerate(codes) if code in 'SI')
+    ap = next(axis for axis, code in enumerate(codes) if code in 'AP')
+    lr = next(axis for axis, code in enumerate(codes) if code in 'LR')
+
+    # After moving the S-I axis first, the in-plane axes stay in storage order
+    transpose = ap > lr
+    return si, transpose, codes[ap] == 'A', codes[lr] == 'R'
 
 class Preprocessor:
-    def __init__(self):
+    def __init__(self, slice_selection="informative", tensor_store=None, cache_dir=None):
+        """
+        slice_selection: which axial slice(s) of a NIfTI volume feed the model:
+                         "informative" (scored, see slice_selection.py) or "middle"
+        tensor_store:    a TensorStore of already preprocessed scans, checked first
+                         by load_and_preprocess (None = always preprocess)
+        cache_dir:       directory for derived data kept across runs: HD-BET brain
+                         masks, .nii.gz seek indexes and slice choices
+                         (None = in-memory caches only, nothing written to disk)
+        """
         # 1. Define the EXACT same transforms used in training
         # This ensures the model sees what it expects to see.
         self.transform = transforms.Compose([
@@ -18,140 +79,416 @@ class Preprocessor:
                 std=[0.229, 0.224, 0.225]
             )
         ])
+        # Same normalization as tensors, for the vectorized multi-slice path
+        self.mean = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+        self.std = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+        # ToTensor + Normalize as a lookup table: (3, 256) float32, one row per channel.
+        # Same float32 ops as the transforms, so the result is bit-identical.
+        levels = torch.arange(256, dtype=torch.float32).div(255)
+        self.lut = ((levels.view(1, 256) - self.mean.view(3, 1)) / self.std.view(3, 1)).numpy()
+        # Seekable .nii.gz reads (no-op without indexed_gzip)
+        self.cache_dir = cache_dir
+        self.gzip_index = GzipIndexStore(self._cache_path("gzip_index"))
+        # HD-BET session reused across scans (call skull_stripper.warm_up() to load it early)
+        self.skull_stripper = SkullStripper(cache_dir=self._cache_path("brain_masks"))
+        if slice_selection not in ("informative", "middle"):
+            raise ValueError(f"Unknown slice selection: {slice_selection}")
+        self.slice_selection = slice_selection
+        self.tensor_store = tensor_store
+        # Slice indices chosen per scan: small in-memory LRU in front of .json files
+        self._slice_choices = LRUCache(256)
+        self._slice_choice_disk = None
+
+    def _cache_path(self, name):
+        return os.path.join(self.cache_dir, name) if self.cache_dir else None
 
     def load_and_preprocess(self, file_path):
         """
         Smart function that detects file type and processes accordingly.
         Returns: A Tensor of shape (1, 3, 224, 224) ready for the model.
         """
+        planes = self.load_planes(file_path)
+        return None if planes is None else self._planes_to_tensor(planes)
+
+    def variant(self, file_path):
+        """
+        Settings besides PREPROCESSING_VERSION that change a scan's planes: the slice
+        selection and, for NIfTI volumes, the skull stripper (installing or upgrading
+        HD-BET changes the output). Part of every cache key of preprocessed data.
+        """
+        if not is_nifti(file_path): return self.slice_selection
+        return f"{self.slice_selection}:{self.skull_stripper.fingerprint()}"
+
+    def _strip_failed(self, mask):
+        """True when HD-BET is installed but gave no usable mask: the volume is used unstripped."""
+        return mask is None and self.skull_stripper.available
+
+    def batch_from_planes(self, planes_list):
+        """
+        Builds the model batch for several scans: allocates ONE (N, 3, 224, 224)
+        tensor and normalizes each scan's uint8 planes straight into its slot.
+        """
+        batch = torch.empty(len(planes_list), 3, INPUT_SIZE, INPUT_SIZE)
+        for i, planes in enumerate(planes_list):
+            self._planes_into(planes, batch[i])
+        return batch
+
+    def load_planes(self, file_path):
+        """
+        Model-ready uint8 (C, 224, 224) planes of a scan (C = 1 for grey, 3 for colour),
+        from the tensor store when it already has them. None if preprocessing failed.
+        """
+        return self.load_planes_with_status(file_path)[0]
+
+    def load_planes_with_status(self, file_path):
+        """
+        load_planes, plus whether the result is complete: False when skull stripping
+        failed (possibly transiently) and the volume was used unstripped. Incomplete
+        planes are not stored, and callers shouldn't cache anything derived from them.
+        Returns: (planes or None, complete)
+        """
         ext = os.path.splitext(file_path)[1].lower()
+        if ext not in IMAGE_EXTENSIONS and not is_nifti(file_path):
+            raise ValueError(f"Unsupported file format: {ext}")
 
-        if ext in ['.jpg', '.jpeg', '.png', '.bmp']:
-            return self._process_standard_image(file_path)
-        
-        elif ext in ['.nii', '.nii.gz']:
-            return self._process_nifti_volume(file_path)
-        
+        # 1. Already preprocessed (same file content, same pipeline version)?
+        store_key = None
+        if self.tensor_store is not None:
+            with span("tensor_store_lookup"):
+                store_key = self.tensor_store.key(file_path, f"{PREPROCESSING_VERSION}:{self.variant(file_path)}")
+                planes = self.tensor_store.get(store_key)
+            if planes is not None: return planes, True
+
+        # 2. Preprocess
+        if ext in IMAGE_EXTENSIONS:
+            planes, complete = self._image_planes(file_path), True
         else:
-            raise ValueError(f"Unsupported file format: {ext}")
+            planes, complete = self._nifti_planes(file_path)
+
+        # 3. Store for the next run
+        if planes is not None and complete and store_key is not None:
+            try:
+                self.tensor_store.put(store_key, planes)
+            except OSError as e:
+                print(f"⚠️ Could not write tensor store: {e}")
+        return planes, complete
+
+    def _planes_to_tensor(self, planes):
+        tensor = torch.empty(1, 3, INPUT_SIZE, INPUT_SIZE)
+        self._planes_into(planes, tensor[0])
+        return tensor # (1, 3, 224, 224)
+
+    def _planes_into(self, planes, out):
+        """
+        uint8 (C, 224, 224) planes -> normalized (3, 224, 224) values in `out`.
+        ToTensor + Normalize are one per-channel LUT lookup (grey planes feed all 3 channels).
+        """
+        with span("normalize"):
+            out_np = out.numpy()
+            for c in range(3):
+                np.take(self.lut[c], planes[c if len(planes) == 3 else 0], out=out_np[c])
+
+    def _resize_planes(self, image):
+        """uint8 PIL image (RGB or L) -> (C, 224, 224) planes, same bilinear filter as transforms.Resize."""
+        with span("resize"):
+            pixels = np.asarray(image.resize((INPUT_SIZE, INPUT_SIZE), Image.BILINEAR))
+            if pixels.ndim == 2:
+                return pixels[None]
+            if (pixels[..., 0] == pixels[..., 1]).all() and (pixels[..., 0] == pixels[..., 2]).all():
+                return np.ascontiguousarray(pixels[..., 0])[None] # Grey stored as RGB
+            return np.ascontiguousarray(pixels.transpose(2, 0, 1))
 
     def _process_standard_image(self, path):
         """Handle standard 2D images (JPG, PNG)"""
+        planes = self._image_planes(path)
+        return None if planes is None else self._planes_to_tensor(planes)
+
+    def _image_planes(self, path):
+        """
+        Fused decode -> resize for 2D images, equivalent to self.transform once the
+        LUT is applied (see _planes_into):
+        - JPEGs much larger than the input are decoded at reduced scale (draft mode:
+          the DCT is scaled down by a power of two, at least DRAFT_FACTOR x 224 is kept)
+        - the resize runs on the uint8 image (same PIL bilinear filter as transforms.Resize)
+        """
         try:
-            image = Image.open(path).convert('RGB')
-            tensor = self.transform(image)
-            return tensor.unsqueeze(0) # Add batch dimension -> (1, 3, 224, 224)
+            with span("decode"):
+                image = Image.open(path)
+                if image.format == 'JPEG' and min(image.size) >= 2 * DRAFT_FACTOR * INPUT_SIZE:
+                    image.draft('RGB', (DRAFT_FACTOR * INPUT_SIZE, DRAFT_FACTOR * INPUT_SIZE))
+                image = image.convert('RGB')
+            return self._resize_planes(image)
         except Exception as e:
             print(f"Error processing image: {e}")
             return None
 
     def _process_nifti_volume(self, path):
+        """Handle 3D Medical Files (.nii / .nii.gz), see _nifti_planes."""
+        planes, _ = self._nifti_planes(path)
+        return None if planes is None else self._planes_to_tensor(planes)
+
+    def _nifti_planes(self, path):
         """
         Handle 3D Medical Files (.nii).
-        Strategy: Extract the middle AXIAL slice to match training data orientation.
+        Strategy: Extract the most informative AXIAL slice (or the middle one, see
+        slice_selection) to match training data orientation.
         
         IMPORTANT: 3D MRI volumes contain three anatomical views:
-        - Axial (axis 0): Horizontal slices, top-down view (BRAIN CROSS-SECTION) ✅
-        - Sagittal (axis 2): Vertical slices, side view (PROFILE)
-        - Coronal (axis 1): Vertical slices, front view (FACE-ON)
+        - Axial: Horizontal slices, top-down view (BRAIN CROSS-SECTION) ✅
+        - Sagittal: Vertical slices, side view (PROFILE)
+        - Coronal: Vertical slices, front view (FACE-ON)
         
-        The model was trained on AXIAL images, so we MUST extract along axis 0.
+        The model was trained on AXIAL images. Which voxel axis is axial depends on
+        the scanner, so it is read from the affine (see axial_layout, and
+        test_nifti_orientation.py to check a file visually).
+        Returns: (uint8 (1, 224, 224) plane or None, False if skull stripping failed)
         """
         try:
-            # 1. Attempt Skull Stripping using HD-BET (if installed)
-            load_path = path 
-            temp_stripped_path = None
+            with self._open_nifti(path) as (nii_img, mask):
+                # Find the best AXIAL slice (superior-inferior axis from the header)
+                layout = axial_layout(nii_img)
+                indices = self._choose_slices(path, nii_img, mask, layout, 1)
 
-            try:
-                # HD-BET 2.0+ API Usage
-                from HD_BET.run import run_hd_bet
-                # Legacy API check - if this works, great (it likely won't on v2.0)
-                
-                print("🧠 Performing Skull Stripping with HD-BET (Legacy)...")
-                # ... legacy code ...
-            except ImportError:
-                # Try New API
-                try:
-                    from HD_BET.entry_point import get_hdbet_predictor, hdbet_predict, maybe_download_parameters
-                    import torch
-                    
-                    print("🧠 Performing Skull Stripping with HD-BET (v2.0)...")
-                    
-                    import tempfile
-                    tf = tempfile.NamedTemporaryFile(suffix='.nii.gz', delete=False) 
-                    # HD-BET often prefers .nii.gz
-                    temp_stripped_path = tf.name
-                    tf.close()
-
-                    # Ensure parameters are downloaded
-                    maybe_download_parameters()
-                    
-                    # Init Predictor (using CPU for Mac/Windows compatibility as requested)
-                    # Note: HD-BET 2.0 defaults to CUDA, so we must specify CPU
-                    device = torch.device('cpu')
-                    predictor = get_hdbet_predictor(device=device)
-                    
-                    # Run Prediction
-                    hdbet_predict(path, temp_stripped_path, predictor)
-                    
-                    load_path = temp_stripped_path
-                    print("✅ Skull Stripping Complete.")
-
-                except ImportError:
-                    print("⚠️ HD-BET not installed or API mismatch. Skipping. (pip install HD-BET)")
-                except Exception as e:
-                    print(f"⚠️ Skull stripping failed: {e}")
-
-            except Exception as e:
-                 # Catch-all for the first block if it wasn't an ImportError but something else
-                 print(f"⚠️ Skull stripping failed (Legacy): {e}")
-
-            # 2. Load the 3D volume
-            if not os.path.exists(load_path):
-                # Fallback if the output file wasn't created
-                load_path = path
-
-            nii_img = nib.load(load_path)
-            nii_data = nii_img.get_fdata()
-
-            # 2. Find the middle AXIAL slice (axis 0)
-            # NIfTI shape is typically (Axial_slices, Height, Width) or similar
-            total_slices = nii_data.shape[0]  # Changed from shape[2] to shape[0]
-            middle_index = total_slices // 2
-            
-            # Extract AXIAL slice (horizontal cross-section of brain)
-            slice_2d = nii_data[middle_index, :, :]  # Changed indexing
-
-            # 3. Normalize to 0-255 range (Standard Image format)
-            # MRI data can be wildly different ranges, so we min-max normalize first
-            slice_2d = (slice_2d - np.min(slice_2d)) / (np.max(slice_2d) - np.min(slice_2d))
-            slice_2d = (slice_2d * 255).astype(np.uint8)
-
-            # 4. Convert to RGB (Model expects 3 channels)
-            # We stack the grayscale image 3 times to fake RGB
-            slice_rgb = np.stack((slice_2d,)*3, axis=-1)
-            
-            # 5. Convert to PIL Image and Transform
-            # 5. Convert to PIL Image and Transform
-            image = Image.fromarray(slice_rgb)
-            tensor = self.transform(image)
-            
-            # Cleanup temp file if it exists
-            if temp_stripped_path and os.path.exists(temp_stripped_path):
-                try:
-                    os.remove(temp_stripped_path)
-                except: pass
+                # Extract AXIAL slice (horizontal cross-section of brain), only this slice is read
+                slice_2d = self._read_slices(nii_img, indices, mask, layout)
+                complete = not self._strip_failed(mask)
 
-            return tensor.unsqueeze(0) # Add batch dimension
+            return self._slices_to_planes(slice_2d), complete
 
         except Exception as e:
             print(f"Error processing NII file: {e}")
-            # Cleanup temp file on error too
-            if 'temp_stripped_path' in locals() and temp_stripped_path and os.path.exists(temp_stripped_path):
+            return None, False
+
+    def load_volume_slab(self, path, num_slices=20):
+        """
+        Multi-slice NIfTI mode: extracts the `num_slices` most informative axial
+        slices (or those centred on the middle, see slice_selection). Every slice goes
+        through the same uint8 resize + LUT as the single-slice path, so slice i of
+        the slab is exactly what predict() would feed the model for that slice.
+        The planes are kept in the tensor store like single scans.
+        Returns: (Tensor of shape (N, 3, 224, 224), list of slice indices) or (None, None)
+        """
+        try:
+            if not is_nifti(path):
+                raise ValueError(f"Not a NIfTI volume: {path}")
+
+            # 1. Already preprocessed (same file, pipeline version and slab size)?
+            store_key = None
+            if self.tensor_store is not None:
+                with span("tensor_store_lookup"):
+                    store_key = self.tensor_store.key(
+                        path, f"{PREPROCESSING_VERSION}:{self.variant(path)}:slab{num_slices}")
+                    slab = self.tensor_store.get(store_key)
+                    indices = self.tensor_store.meta(store_key)
+                if slab is not None and indices is not None:
+                    return self.batch_from_planes(slab[:, None]), indices
+
+            # 2. Preprocess
+            with self._open_nifti(path) as (nii_img, mask):
+                layout = axial_layout(nii_img)
+                indices = self._choose_slices(path, nii_img, mask, layout, num_slices)
+
+                slab = self._read_slices(nii_img, indices, mask, layout)
+                complete = not self._strip_failed(mask)
+            slab = self._slices_to_planes(slab)
+
+            # 3. Store for the next run (the slice indices go along as metadata)
+            if store_key is not None and complete:
                 try:
-                    os.remove(temp_stripped_path)
-                except: pass
+                    self.tensor_store.put(store_key, slab, meta=indices)
+                except OSError as e:
+                    print(f"⚠️ Could not write tensor store: {e}")
+            return self.batch_from_planes(slab[:, None]), indices
+
+        except Exception as e:
+            print(f"Error processing NII file: {e}")
+            return None, None
+
+    def _slices_to_planes(self, slices):
+        """
+        (N, H, W) float32 slices -> uint8 (N, 224, 224) grey planes.
+        MRI data can be wildly different ranges, so each slice is min-max normalized
+        to 0-255 first (vectorized over the stack), then resized as a grey image:
+        the model's 3 channels are faked from this one plane by the LUT (same result
+        as resizing the stacked RGB copy).
+        """
+        with span("intensity"):
+            mins = slices.min(axis=(1, 2), keepdims=True)
+            maxs = slices.max(axis=(1, 2), keepdims=True)
+            slices = (slices - mins) / np.maximum(maxs - mins, 1e-8)
+            slices = (slices * 255).astype(np.uint8)
+        return np.concatenate([self._resize_planes(Image.fromarray(s)) for s in slices])
+
+    def augment(self, tensor, num_variants=8, seed=0):
+        """
+        Test-time augmentation: builds `num_variants` variants of ONE preprocessed
+        (1, 3, 224, 224) tensor as a single (K, 3, 224, 224) batch.
+        Variant 0 is always the unchanged input; the others get a small random
+        rotation (±10°) and brightness/contrast jitter (±10%), and every odd variant
+        is also flipped horizontally (deterministic: half the batch is mirrored).
+        All variants are generated together with one affine_grid/grid_sample call.
+        """
+        k = num_variants
+        generator = torch.Generator().manual_seed(seed) # Same variants for every call
+
+        # 1. Back to [0, 1] so rotations pad with black and jitter acts on intensities
+        image = (tensor * self.std + self.mean).expand(k, -1, -1, -1)
+
+        # 2. Per-variant parameters (variant 0 = identity)
+        flips = torch.ones(k)
+        flips[1::2] = -1.0 # Odd variants mirrored
+        angles = torch.deg2rad((torch.rand(k, generator=generator) * 2 - 1) * 10.0)
+        gains = 1.0 + (torch.rand(k, generator=generator) * 2 - 1) * 0.1
+        biases = (torch.rand(k, generator=generator) * 2 - 1) * 0.05
+        angles[0], gains[0], biases[0] = 0.0, 1.0, 0.0
+
+        # 3. Flip + rotation in one batched warp
+        cos, sin = torch.cos(angles), torch.sin(angles)
+        theta = torch.zeros(k, 2, 3)
+        theta[:, 0, 0] = cos * flips
+        theta[:, 0, 1] = -sin
+        theta[:, 1, 0] = sin * flips
+        theta[:, 1, 1] = cos
+        grid = F.affine_grid(theta, list(image.shape), align_corners=False)
+        image = F.grid_sample(image, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+        # 4. Intensity jitter, then normalize again
+        image = (image * gains.view(k, 1, 1, 1) + biases.view(k, 1, 1, 1)).clamp_(0, 1)
+        return (image - self.mean) / self.std
+
+    @contextmanager
+    def _open_nifti(self, path):
+        """
+        Opens the 3D volume LAZILY: only the header is parsed, voxels are read by
+        _read_slices. Yields (image, brain mask or None); the mask comes from HD-BET
+        (if available) and is applied slice by slice. The image is only valid
+        inside the `with` block.
+        """
+        close_gz = None
+        try:
+            # 1. Brain mask from HD-BET (cached per scan, see SkullStripper.brain_mask)
+            with span("skull_strip"):
+                mask = self.skull_stripper.brain_mask(path)
+
+            # 2. Open the 3D volume (uncompressed .nii is memory-mapped, nothing is read yet)
+            with span("open_volume"):
+                nii_img = None
+                if path.lower().endswith('.gz'):
+                    # Archived .nii.gz: seek straight to the slices through the persisted index
+                    try:
+                        opened = self.gzip_index.open(path)
+                        if opened is not None: nii_img, close_gz = opened
+                    except Exception as e:
+                        print(f"⚠️ Indexed gzip read failed, decompressing sequentially: {e}")
+                if nii_img is None:
+                    nii_img = nib.load(path, mmap=not path.lower().endswith('.gz'))
+
+            if mask is not None and mask.shape != nii_img.shape[:3]:
+                print(f"⚠️ Brain mask shape {mask.shape} does not match the volume {nii_img.shape}, ignoring it")
+                mask = None
+            yield nii_img, mask
+        finally:
+            if close_gz is not None: close_gz()
+
+    def _choose_slices(self, path, nii_img, mask, layout, k):
+        """
+        Picks the k axial slice indices to feed the model. "informative" scores every
+        slice on a copy of the volume downsampled SCORE_STRIDE x in-plane. The
+        in-plane stride saves compute, not I/O: a .nii.gz is still decompressed in
+        full and an mmap'd .nii touched page by page. So the choice is persisted per
+        scan content + variant (HD-BET install) + PREPROCESSING_VERSION, and later
+        reads of the scan only seek to the chosen slices.
+        """
+        axis = layout[0]
+        total_slices = nii_img.shape[axis]
+        k = max(1, min(k, total_slices))
+        if self.slice_selection == "middle":
+            return middle_slices(total_slices, k)
+
+        raw = f"{file_digest(path)}:{self.variant(path)}:{PREPROCESSING_VERSION}:{k}"
+        key = hashlib.sha256(raw.encode()).hexdigest()
+        indices = self._load_slice_choice(key)
+        if indices is not None: return indices
+
+        with span("select_slices"):
+            slicer = [slice(None, None, SCORE_STRIDE)] * 3
+            slicer[axis] = slice(None)
+            slicer = tuple(slicer)
+            volume = np.asarray(nii_img.dataobj[slicer], dtype=np.float32)
+            if mask is not None:
+                volume = volume * mask[slicer]
+            scores, _ = score_slices(np.moveaxis(volume, axis, 0))
+            indices = select_slices(scores, k)
+
+        # Scored without the brain mask after an HD-BET failure: don't keep the choice
+        if not self._strip_failed(mask):
+            self._store_slice_choice(key, indices)
+        return indices
+
+    def _slice_choice_cache(self):
+        if self.cache_dir is None: return None
+        if self._slice_choice_disk is None:
+            self._slice_choice_disk = DiskCache(self._cache_path("slice_choices"), 16 * 1024 * 1024, '.json')
+        return self._slice_choice_disk
+
+    def _load_slice_choice(self, key):
+        indices = self._slice_choices.get(key)
+        if indices is not None: return indices
+
+        disk = self._slice_choice_cache()
+        cached_path = disk.get(key) if disk is not None else None
+        if cached_path is None: return None
+        try:
+            with open(cached_path) as f:
+                indices = [int(i) for i in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            print(f"⚠️ Ignoring unreadable slice choice cache entry {cached_path}: {e}")
             return None
+        self._slice_choices.put(key, indices)
+        return indices
+
+    def _store_slice_choice(self, key, indices):
+        self._slice_choices.put(key, indices)
+        disk = self._slice_choice_cache()
+        if disk is None: return
+        def write(tmp_path):
+            with open(tmp_path, 'w') as f:
+                json.dump(indices, f)
+        try:
+            disk.put(key, write)
+        except OSError as e:
+            print(f"⚠️ Could not write slice choice cache: {e}")
+
+    @staticmethod
+    def _read_slices(nii_img, index, mask=None, layout=(0, False, False, False)):
+        """
+        Reads and scales only the axial slices `index` (a slice object, or a list of
+        indices, along the axial axis of `layout`, see axial_layout) through the dataobj array proxy,
+        as float32, instead of get_fdata() decoding the whole volume to float64.
+        Only that slab is read and reoriented (views, then one copy), never the volume.
+        Voxels outside the brain mask (if any) are zeroed, as in HD-BET's output.
+        Returns: (N, rows, columns) float32
+        """
+        if isinstance(index, (list, tuple)):
+            # The array proxy has no fancy indexing: read each (possibly scattered) slice
+            return np.concatenate([Preprocessor._read_slices(nii_img, slice(i, i + 1), mask, layout)
+                                   for i in index])
+
+        axis, transpose, flip_rows, flip_cols = layout
+        slicer = [slice(None)] * 3
+        slicer[axis] = index
+        slicer = tuple(slicer)
+
+        with span("read_slices"):
+            data = np.asarray(nii_img.dataobj[slicer], dtype=np.float32)
+            if mask is not None:
+                data = data * mask[slicer]
+
+            data = np.moveaxis(data, axis, 0)
+            if transpose: data = data.transpose(0, 2, 1)
+            if flip_rows: data = data[:, ::-1, :]
+            if flip_cols: data = data[:, :, ::-1]
+            return np.array(data, dtype=np.float32) # Contiguous copy, never a view into the mmap
 
 # --- Quick Test Block ---
 if __name__ == "__main__":
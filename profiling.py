@@ -0,0 +1,131 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+import torch
+
+# Histogram bucket upper bounds in milliseconds (the last bucket is "more than 60 s")
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+
+# The StageTimer of the request running in the current thread / task (if any)
+_current_timer = contextvars.ContextVar("current_timer", default=None)
+
+class StageHistograms:
+    """Process-wide, thread-safe latency histograms per pipeline stage."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, stage, ms):
+        with self._lock:
+            stats = self._stats.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                                   "buckets": [0] * (len(BUCKETS_MS) + 1)})
+            stats["count"] += 1
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            stats["buckets"][bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def snapshot(self):
+        """Returns {stage: {count, mean_ms, max_ms, p50_ms, p95_ms, buckets}} (percentiles are bucket bounds)."""
+        with self._lock:
+            result = {}
+            for stage, stats in sorted(self._stats.items()):
+                result[stage] = {
+                    "count": stats["count"],
+                    "mean_ms": round(stats["total_ms"] / stats["count"], 3),
+                    "max_ms": round(stats["max_ms"], 3),
+                    "p50_ms": self._percentile(stats, 0.50),
+                    "p95_ms": self._percentile(stats, 0.95),
+                    "buckets": dict(zip([f"le_{b}" for b in BUCKETS_MS] + ["inf"], stats["buckets"])),
+                }
+            return result
+
+    @staticmethod
+    def _percentile(stats, q):
+        target, seen = q * stats["count"], 0
+        for bound, count in zip(BUCKETS_MS + [float("inf")], stats["buckets"]):
+            seen += count
+            if seen >= target:
+                return bound if bound != float("inf") else round(stats["max_ms"], 3)
+        return round(stats["max_ms"], 3)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+# Aggregated over every request in this process
+STAGE_HISTOGRAMS = StageHistograms()
+
+class StageTimer:
+    """
+    Collects the timing spans of ONE request. Nested spans get dotted names
+    (e.g. "preprocess.skull_strip"). Usage:
+        timer = StageTimer()
+        with timer.activate():
+            with span("preprocess"): ...
+        timer.spans -> [{"stage": "preprocess", "ms": 12.3}, ...]
+    """
+    def __init__(self):
+        self.spans = []
+        self._stack = []
+
+    @contextmanager
+    def activate(self):
+        """Makes this timer the target of span() calls in the current thread."""
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    def total_ms(self, stage):
+        return sum(s["ms"] for s in self.spans if s["stage"] == stage)
+
+@contextmanager
+def span(name):
+    """
+    Times a pipeline stage for the active StageTimer (no-op without one) and
+    records it in the process-wide histograms. The stage also shows up as a
+    labelled range in torch.profiler traces.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+
+    stage = ".".join(timer._stack + [name])
+    entry = {"stage": stage, "ms": None}
+    timer.spans.append(entry) # Appended on entry so spans stay in start order
+    timer._stack.append(name)
+    start = time.perf_counter()
+    try:
+        with torch.profiler.record_function(stage):
+            yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        timer._stack.pop()
+        entry["ms"] = round(ms, 3)
+        STAGE_HISTOGRAMS.record(stage, ms)
+
+def format_timings(spans):
+    """One line per span, indented by nesting depth (for logs)."""
+    return "\n".join(f"{'  ' * s['stage'].count('.')}{s['stage'].rsplit('.', 1)[-1]}: {s['ms']:.1f} ms"
+                     for s in spans if s["ms"] is not None)
+
+def torch_trace(trace_path):
+    """
+    Opt-in torch.profiler trace (Chrome trace JSON, open in chrome://tracing or
+    Perfetto). Returns a no-op context when trace_path is None.
+    """
+    if trace_path is None:
+        return nullcontext()
+
+    @contextmanager
+    def _trace():
+        with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU],
+                                    record_shapes=True) as prof:
+            yield prof
+        prof.export_chrome_trace(trace_path)
+        print(f"📈 torch.profiler trace written to {trace_path}")
+    return _trace()
@@ -0,0 +1,176 @@
+"""
+INT8 quantized inference for CPU-only deployments.
+
+1. Quantize (default):
+   - Post-training STATIC quantization of the ResNet-50 backbone (FX graph mode),
+     calibrated on a sample of FINAL_DATASET/val (produced by merge_datasets.py).
+   - DYNAMIC quantization of the fc head (int8 weights, fp32 activations).
+   - Writes <name>.int8.torchscript.pt next to the checkpoint -> backend="int8".
+
+2. Compare (--compare):
+   - Runs fp32 and int8 side by side on FINAL_DATASET/test and reports the
+     predicted-class agreement, confidence differences, accuracy and speedup.
+
+Usage:
+    python quantize_model.py --model models/alzheimer_resnet50_best.pth
+    python quantize_model.py --model models/alzheimer_resnet50_best.pth --compare
+"""
+import argparse
+import copy
+import os
+import random
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from inference import AlzheimerPredictor
+from backends import FeatureMapResNet, exported_model_path
+
+# --- CONFIGURATION ---
+DEFAULT_MODEL_PATH = "models/alzheimer_resnet50_best.pth"
+DATASET_DIR = "FINAL_DATASET"
+CALIBRATION_IMAGES = 256 # Randomly sampled from the val split
+BATCH_SIZE = 32
+
+def pick_quant_engine():
+    """x86/fbgemm on Intel/AMD, qnnpack on ARM (Apple Silicon)."""
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in torch.backends.quantized.supported_engines:
+            return engine
+    raise RuntimeError("No quantized CPU engine available in this PyTorch build")
+
+def list_split(split):
+    """Returns [(image_path, class_name)] for FINAL_DATASET/<split>/<Class_Folder>/*"""
+    split_dir = os.path.join(DATASET_DIR, split)
+    if not os.path.exists(split_dir):
+        raise FileNotFoundError(f"{split_dir} not found. Run merge_datasets.py first.")
+
+    samples = []
+    for class_folder in sorted(os.listdir(split_dir)):
+        class_dir = os.path.join(split_dir, class_folder)
+        if not os.path.isdir(class_dir): continue
+        for file in sorted(os.listdir(class_dir)):
+            if file.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
+                # "Very_Mild_Demented" -> "Very Mild Demented" (AlzheimerPredictor.class_names)
+                samples.append((os.path.join(class_dir, file), class_folder.replace('_', ' ')))
+    return samples
+
+def iter_batches(predictor, samples, batch_size=BATCH_SIZE):
+    """Yields (batch tensor, labels) with the predictor's own preprocessing."""
+    for start in range(0, len(samples), batch_size):
+        tensors, labels = [], []
+        for path, label in samples[start:start + batch_size]:
+            tensor = predictor.preprocessor.load_and_preprocess(path)
+            if tensor is not None:
+                tensors.append(tensor)
+                labels.append(label)
+        if tensors:
+            yield torch.cat(tensors), labels
+
+def quantize(model_path, num_calibration):
+    engine = pick_quant_engine()
+    torch.backends.quantized.engine = engine
+    print(f"⚙️ Quantized engine: {engine}")
+
+    predictor = AlzheimerPredictor(model_path)
+    # Only the preprocessing of this predictor is used from here on; drop the
+    # Grad-CAM hook so the model can be copied and FX-traced cleanly.
+    predictor.gradcam.remove()
+    wrapper = copy.deepcopy(FeatureMapResNet(predictor.model)).eval()
+
+    # 1. Static quantization of the backbone (conv/bn/relu get fused by prepare_fx)
+    example = torch.randn(1, 3, 224, 224)
+    prepared = prepare_fx(wrapper.features, get_default_qconfig_mapping(engine), (example,))
+
+    # 2. Calibrate observers on a random sample of the val split
+    samples = list_split("val")
+    random.seed(0)
+    random.shuffle(samples)
+    samples = samples[:num_calibration]
+    print(f"📏 Calibrating on {len(samples)} validation images...")
+    with torch.no_grad():
+        for batch, _ in iter_batches(predictor, samples):
+            prepared(batch)
+    wrapper.features = convert_fx(prepared)
+
+    # 3. Dynamic quantization of the fc head
+    wrapper.fc = quantize_dynamic(wrapper.fc, {nn.Linear}, dtype=torch.qint8)
+
+    # 4. Save as TorchScript (records the engine so the backend can restore it)
+    path = exported_model_path(model_path, 'int8')
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(wrapper, example))
+    torch.jit.save(traced, path, _extra_files={'quant_engine': engine})
+    print(f"✅ INT8 model saved to {path}")
+    print(f"   Size: {os.path.getsize(model_path) / 1e6:.1f} MB (fp32) -> {os.path.getsize(path) / 1e6:.1f} MB (int8)")
+
+def compare(model_path, limit=None):
+    """Parity report: fp32 vs int8 on the test split."""
+    fp32 = AlzheimerPredictor(model_path)
+    int8 = AlzheimerPredictor(model_path, backend="int8")
+
+    samples = list_split("test")
+    if limit:
+        # Random subset so every class is represented
+        random.Random(0).shuffle(samples)
+        samples = samples[:limit]
+    print(f"🔬 Comparing fp32 vs int8 on {len(samples)} test images...")
+
+    agree, total = 0, 0
+    correct = {'fp32': 0, 'int8': 0}
+    conf_diffs = []
+    seconds = {'fp32': 0.0, 'int8': 0.0}
+    per_class = {name: [0, 0] for name in fp32.class_names} # [agree, total]
+
+    for batch, labels in iter_batches(fp32, samples):
+        outputs = {}
+        for name, predictor in (('fp32', fp32), ('int8', int8)):
+            start = time.perf_counter()
+            confidence, predicted_idx, _ = predictor._classify(batch)
+            seconds[name] += time.perf_counter() - start
+            outputs[name] = (confidence.numpy() * 100, predicted_idx.numpy())
+
+        (conf_a, idx_a), (conf_b, idx_b) = outputs['fp32'], outputs['int8']
+        for i, label in enumerate(labels):
+            same = idx_a[i] == idx_b[i]
+            agree += int(same)
+            total += 1
+            per_class[fp32.class_names[idx_a[i]]][0] += int(same)
+            per_class[fp32.class_names[idx_a[i]]][1] += 1
+            correct['fp32'] += int(fp32.class_names[idx_a[i]] == label)
+            correct['int8'] += int(fp32.class_names[idx_b[i]] == label)
+            if same: conf_diffs.append(abs(conf_a[i] - conf_b[i]))
+
+    if total == 0:
+        print("❌ No test images could be loaded.")
+        return
+
+    conf_diffs = np.array(conf_diffs) if conf_diffs else np.zeros(1)
+    print("\n--- PARITY REPORT (fp32 vs int8) ---")
+    print(f"Class agreement:      {agree}/{total} ({100 * agree / total:.2f}%)")
+    for name, (a, n) in per_class.items():
+        if n: print(f"   {name:<20} {a}/{n} ({100 * a / n:.2f}%)")
+    print(f"Confidence |diff|:    mean={conf_diffs.mean():.2f} pts, max={conf_diffs.max():.2f} pts (agreeing samples)")
+    print(f"Accuracy fp32:        {100 * correct['fp32'] / total:.2f}%")
+    print(f"Accuracy int8:        {100 * correct['int8'] / total:.2f}%")
+    print(f"Latency fp32:         {1000 * seconds['fp32'] / total:.2f} ms/image")
+    print(f"Latency int8:         {1000 * seconds['int8'] / total:.2f} ms/image")
+    print(f"Speedup:              {seconds['fp32'] / max(seconds['int8'], 1e-9):.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 quantization of the Alzheimer ResNet-50")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path to the trained .pth checkpoint")
+    parser.add_argument("--calibration-images", type=int, default=CALIBRATION_IMAGES)
+    parser.add_argument("--compare", action="store_true", help="Report fp32 vs int8 parity on the test split")
+    parser.add_argument("--limit", type=int, default=None, help="Max test images for --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.model, args.limit)
+    else:
+        quantize(args.model, args.calibration_images)
+
+if __name__ == "__main__":
+    main()
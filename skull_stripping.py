@@ -0,0 +1,214 @@
+import hashlib
+import os
+import tempfile
+import threading
+import numpy as np
+import nibabel as nib
+import torch
+from caching import file_digest, LRUCache, DiskCache
+
+def hdbet_version():
+    try:
+        from importlib.metadata import version
+        return version("HD-BET")
+    except Exception:
+        return "unknown"
+
+class SkullStripper:
+    """
+    Long-lived HD-BET session, shared by every scan of a Preprocessor.
+
+    - The installed HD-BET API (v2 entry_point or legacy run_hd_bet) is detected ONCE.
+    - The v2 predictor (network + weights) is built ONCE, lazily on the first
+      scan or explicitly via warm_up(), and reused for every later scan.
+    - Stripping is serialized with a lock: the predictor is not thread-safe.
+    - brain_mask() caches its result, keyed by the SHA-256 of the scan + the
+      HD-BET version: a small in-memory LRU in front of bit-packed .npz files
+      in cache_dir (size-bounded, least recently used evicted first; None = the
+      LRU only, nothing written to disk), so re-analysis
+      and multi-slice modes of the same study skip stripping entirely.
+    """
+    def __init__(self, device=torch.device('cpu'), cache_dir=None,
+                 max_cache_bytes=1024 * 1024 * 1024, max_memory_entries=8):
+        # HD-BET 2.0 defaults to CUDA, so we must specify CPU (Mac/Windows compatibility)
+        self.device = device
+        self._api = None # "v2" / "legacy" / "none", set by _detect_api
+        self._predictor = None
+        self._lock = threading.Lock()
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self._memory = LRUCache(max_memory_entries)
+        self._disk = None
+
+    def _detect_api(self):
+        if self._api is not None: return self._api
+        try:
+            from HD_BET.entry_point import get_hdbet_predictor, hdbet_predict, maybe_download_parameters
+            self._api = "v2"
+        except ImportError:
+            try:
+                from HD_BET.run import run_hd_bet
+                self._api = "legacy"
+            except ImportError:
+                print("⚠️ HD-BET not installed or API mismatch. Skipping. (pip install HD-BET)")
+                self._api = "none"
+        return self._api
+
+    @property
+    def available(self):
+        return self._detect_api() != "none"
+
+    def _get_predictor(self):
+        """Downloads the parameters (first run only) and builds the v2 predictor once."""
+        if self._predictor is None:
+            from HD_BET.entry_point import get_hdbet_predictor, maybe_download_parameters
+            print("🧠 Loading HD-BET predictor...")
+            maybe_download_parameters()
+            self._predictor = get_hdbet_predictor(device=self.device)
+        return self._predictor
+
+    def warm_up(self):
+        """Loads HD-BET ahead of the first scan (e.g. at app startup). Returns True if available."""
+        try:
+            with self._lock:
+                if self._detect_api() == "v2":
+                    self._get_predictor()
+            return self.available
+        except Exception as e:
+            print(f"⚠️ HD-BET warm-up failed: {e}")
+            return False
+
+    def _disk_cache(self):
+        # Created on first use so machines without HD-BET get no cache directory
+        if self.cache_dir is None: return None
+        if self._disk is None:
+            self._disk = DiskCache(self.cache_dir, self.max_cache_bytes, '.npz')
+        return self._disk
+
+    def fingerprint(self):
+        """Identifies the stripping applied to volumes (API + HD-BET version), for keys of derived data."""
+        return f"{self._detect_api()}:{hdbet_version()}"
+
+    def cache_key(self, path):
+        raw = f"{file_digest(path)}:{self._api}:{hdbet_version()}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def brain_mask(self, path):
+        """
+        Returns: boolean brain mask with the volume's shape, or None when HD-BET is
+        unavailable or failed (the scan is then used unstripped).
+        """
+        if not self.available: return None
+
+        # 1. Cache lookup
+        key = self.cache_key(path)
+        mask = self._memory.get(key)
+        if mask is not None: return mask
+
+        disk = self._disk_cache()
+        cached_path = disk.get(key) if disk is not None else None
+        if cached_path is not None:
+            try:
+                with np.load(cached_path) as data:
+                    shape = tuple(data['shape'])
+                    mask = np.unpackbits(data['bits'], count=int(np.prod(shape))).astype(bool).reshape(shape)
+                mask.flags.writeable = False
+                self._memory.put(key, mask)
+                return mask
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable brain mask cache entry {cached_path}: {e}")
+
+        # 2. Run HD-BET (in memory when the installed API allows it, else through files).
+        #    A failed prediction is not retried through files: it would fail the same way.
+        try:
+            in_memory = self._supports_in_memory(path)
+        except Exception as e:
+            print(f"⚠️ Skull stripping failed: {e}")
+            return None
+        mask = self._predict_mask_in_memory(path) if in_memory else self._predict_mask_from_files(path)
+        if mask is None: return None
+        mask.flags.writeable = False # Shared between requests through the LRU
+
+        # 3. Store (1 bit per voxel)
+        self._memory.put(key, mask)
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, shape=np.array(mask.shape), bits=np.packbits(mask.ravel()))
+        try:
+            if disk is not None: disk.put(key, write)
+        except OSError as e:
+            print(f"⚠️ Could not write brain mask cache: {e}")
+        return mask
+
+    def _supports_in_memory(self, path):
+        """True when the installed HD-BET can take this scan as an array (v2 predictor, 3D volume)."""
+        if self._api != "v2": return False
+        with self._lock:
+            predictor = self._get_predictor()
+        return hasattr(predictor, "predict_single_npy_array") and len(nib.load(path).shape) == 3
+
+    def _predict_mask_in_memory(self, path):
+        """
+        HD-BET v2 is an nnU-Net predictor: hands it the voxel array directly
+        (predict_single_npy_array) instead of a .nii.gz written to and read back
+        from disk. Arrays follow nnU-Net's SimpleITK convention: axes reversed
+        (z, y, x) with a leading channel axis, spacing reversed to match.
+        Returns: the mask, or None if stripping failed. Check _supports_in_memory first.
+        """
+        try:
+            with self._lock:
+                predictor = self._get_predictor()
+                nii_img = nib.load(path)
+                data = np.asanyarray(nii_img.dataobj, dtype=np.float32)
+                spacing = [float(z) for z in nii_img.header.get_zooms()[:3]][::-1]
+
+                print("🧠 Performing Skull Stripping with HD-BET (v2.0, in memory)...")
+                segmentation = predictor.predict_single_npy_array(
+                    data.transpose(2, 1, 0)[None], {'spacing': spacing}, None, None, False)
+            print("✅ Skull Stripping Complete.")
+            return np.asarray(segmentation).transpose(2, 1, 0) != 0
+        except Exception as e:
+            print(f"⚠️ Skull stripping failed: {e}")
+            return None
+
+    def _predict_mask_from_files(self, path):
+        """Mask from HD-BET's output file: the scan with every non-brain voxel zeroed."""
+        stripped_path, temp_path = self.strip(path)
+        if temp_path is None: return None
+        try:
+            mask = np.asanyarray(nib.load(stripped_path).dataobj) != 0
+        finally:
+            os.remove(temp_path)
+        return mask[..., 0] if mask.ndim > 3 else mask
+
+    def strip(self, path):
+        """
+        Runs HD-BET if installed.
+        Returns: (path of the volume to load, temp file to clean up or None)
+        """
+        if not self.available: return path, None
+
+        tf = tempfile.NamedTemporaryFile(suffix='.nii.gz', delete=False)
+        # HD-BET often prefers .nii.gz
+        temp_stripped_path = tf.name
+        tf.close()
+
+        try:
+            with self._lock:
+                if self._api == "v2":
+                    from HD_BET.entry_point import hdbet_predict
+                    predictor = self._get_predictor()
+                    print("🧠 Performing Skull Stripping with HD-BET (v2.0)...")
+                    hdbet_predict(path, temp_stripped_path, predictor)
+                else:
+                    from HD_BET.run import run_hd_bet
+                    print("🧠 Performing Skull Stripping with HD-BET (Legacy)...")
+                    run_hd_bet(path, temp_stripped_path, mode="fast", device="cpu", do_tta=False,
+                               keep_mask=False)
+            print("✅ Skull Stripping Complete.")
+            return temp_stripped_path, temp_stripped_path
+        except Exception as e:
+            print(f"⚠️ Skull stripping failed: {e}")
+            if os.path.exists(temp_stripped_path):
+                os.remove(temp_stripped_path)
+            return path, None
@@ -0,0 +1,73 @@
+import numpy as np
+
+# In-plane downsampling of the copy that is scored (every axial slice is kept)
+SCORE_STRIDE = 4
+ENTROPY_BINS = 32
+# Relative weights of the per-slice features in the final score
+WEIGHTS = {"brain_fraction": 1.0, "entropy": 1.0, "ventricles": 0.5}
+
+def score_slices(volume):
+    """
+    Scores every axial slice of a (N, H, W) volume (typically downsampled) in one
+    vectorized pass. Higher = more informative for the classifier.
+    Features (each scaled to [0, 1] across the volume, then weighted by WEIGHTS):
+    - brain_fraction: share of the slice covered by tissue
+    - entropy:        intensity entropy of the tissue (flat/empty slices score low)
+    - ventricles:     dark (CSF) voxels in the centre of slices that are mostly
+                      tissue there, a proxy for visible lateral ventricles
+    Returns: (N,) float32 scores, and the features dict.
+    """
+    volume = np.asarray(volume, dtype=np.float32)
+    n, h, w = volume.shape
+
+    # 1. Robust global scaling to [0, 1] (ignores background and hot outliers)
+    foreground = volume[volume > 0]
+    if foreground.size == 0:
+        return np.zeros(n, dtype=np.float32), {}
+    high = np.percentile(foreground, 99)
+    scaled = np.clip(volume / max(high, 1e-8), 0, 1)
+
+    # 2. Brain coverage
+    tissue = scaled > 0.1
+    brain_fraction = tissue.mean(axis=(1, 2))
+
+    # 3. Intensity entropy of the tissue voxels, all slices at once with one bincount
+    bins = np.minimum((scaled * ENTROPY_BINS).astype(np.int64), ENTROPY_BINS - 1)
+    slice_ids = np.broadcast_to(np.arange(n).reshape(n, 1, 1), bins.shape)
+    counts = np.bincount((slice_ids * ENTROPY_BINS + bins)[tissue], minlength=n * ENTROPY_BINS)
+    counts = counts.reshape(n, ENTROPY_BINS).astype(np.float32)
+    probabilities = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    entropy = -(probabilities * np.log2(np.where(probabilities > 0, probabilities, 1))).sum(axis=1)
+
+    # 4. Ventricle proxy: dark voxels in the central region, weighted by how much
+    #    of that region is inside the head (so background doesn't count as CSF)
+    centre = scaled[:, h // 4:3 * h // 4, w // 4:3 * w // 4]
+    centre_tissue = (centre > 0.1).mean(axis=(1, 2))
+    centre_dark = ((centre > 0.02) & (centre < 0.3)).mean(axis=(1, 2))
+    ventricles = centre_dark * centre_tissue
+
+    features = {"brain_fraction": brain_fraction, "entropy": entropy, "ventricles": ventricles}
+    scores = np.zeros(n, dtype=np.float32)
+    for name, values in features.items():
+        scores += WEIGHTS[name] * values / max(float(values.max()), 1e-8)
+    return scores, features
+
+def middle_slices(n, k):
+    """
+    k consecutive slice indices centred on n // 2 (the legacy single middle slice
+    for k = 1, also for even n), clamped to the volume.
+    """
+    start = max(0, min(n // 2 - k // 2, n - k))
+    return list(range(start, start + k))
+
+def select_slices(scores, k):
+    """
+    Top-k slice indices by score, returned in anatomical (index) order.
+    Falls back to the k middle slices when nothing scores (e.g. an empty volume).
+    """
+    n = len(scores)
+    k = max(1, min(k, n))
+    if n == 0 or float(np.max(scores)) <= 0:
+        return middle_slices(n, k)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return sorted(int(i) for i in top)
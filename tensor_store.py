@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+from caching import CACHE_DIR, file_digest
+
+# Preprocessed-slice store (see TensorStore)
+TENSOR_STORE_DIR = os.path.join(CACHE_DIR, "tensor_store")
+SLICE_SIZE = 224
+SLICE_BYTES = SLICE_SIZE * SLICE_SIZE
+
+class TensorStore:
+    """
+    Append-only store of model-ready uint8 slices, so re-scoring a scan (e.g. with
+    a new model) skips decode, skull stripping, slice selection and resizing.
+
+    - slices.u8:   raw 224x224 uint8 planes back to back, memory-mapped for reads;
+                   a grey scan takes 1 plane, a colour image 3
+    - index.jsonl: one {"key", "slot", "count"} line per entry (plus "meta" when
+                   given, e.g. the slice indices of a slab), appended after its
+                   planes are written (a crash never indexes a half-written entry)
+    Keys hash the source file's content with the preprocessing version and variant
+    (see Preprocessor.variant), so entries of an older pipeline or of another
+    HD-BET install are simply never looked up again.
+
+    The store is append-only and never evicts (entries stay valid for readers that
+    mapped them), so it is meant for batch runs that opt in explicitly
+    (batch_score.py --tensor-store), not for long-lived interactive use.
+
+    get() returns a zero-copy view into the mapping. Several processes may read
+    (new entries from other writers are picked up on a miss), but only one
+    process should write at a time; pass read_only=True to the others.
+    """
+    def __init__(self, directory=TENSOR_STORE_DIR, read_only=False):
+        self.directory = directory
+        self.read_only = read_only
+        self.data_path = os.path.join(directory, "slices.u8")
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self._lock = threading.Lock()
+        self._index = {}
+        self._meta = {}
+        self._index_offset = 0 # Bytes of index.jsonl already parsed
+        self._mmap = None
+        os.makedirs(directory, exist_ok=True)
+        self._refresh_index()
+
+    def key(self, path, version):
+        raw = f"{file_digest(path)}:{version}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _refresh_index(self):
+        """Parses index lines appended since the last call."""
+        if not os.path.exists(self.index_path): return
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith(b"\n"): break # Entry still being written
+                self._index_offset += len(line)
+                try:
+                    entry = json.loads(line)
+                    self._index[entry["key"]] = (entry["slot"], entry["count"])
+                    if "meta" in entry: self._meta[entry["key"]] = entry["meta"]
+                except (ValueError, KeyError):
+                    pass
+
+    def _planes(self, slot, count):
+        end = (slot + count) * SLICE_BYTES
+        if self._mmap is None or self._mmap.shape[0] < end:
+            # The file grew since it was mapped: map it again (older views stay valid)
+            self._mmap = np.memmap(self.data_path, dtype=np.uint8, mode='r')
+        return self._mmap[slot * SLICE_BYTES:end].reshape(count, SLICE_SIZE, SLICE_SIZE)
+
+    def get(self, key):
+        """Returns: read-only (C, 224, 224) uint8 view (C = 1 or 3), or None."""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self._refresh_index()
+                entry = self._index.get(key)
+            if entry is None: return None
+            return self._planes(*entry)
+
+    def meta(self, key):
+        """Returns: the JSON metadata stored with `key` by put(), or None."""
+        with self._lock:
+            return self._meta.get(key)
+
+    def put(self, key, planes, meta=None):
+        """Appends (C, 224, 224) uint8 planes under `key`, with optional JSON-serializable metadata."""
+        if self.read_only: return
+        planes = np.ascontiguousarray(planes, dtype=np.uint8)
+        if planes.shape[1:] != (SLICE_SIZE, SLICE_SIZE):
+            raise ValueError(f"Expected (C, {SLICE_SIZE}, {SLICE_SIZE}) planes, got {planes.shape}")
+
+        with self._lock:
+            if key in self._index: return
+            with open(self.data_path, 'ab') as f:
+                offset = f.tell()
+                if offset % SLICE_BYTES:
+                    # Leftover of an interrupted write: pad to the next slot boundary
+                    f.write(b"\0" * (SLICE_BYTES - offset % SLICE_BYTES))
+                    offset = f.tell()
+                f.write(planes.tobytes())
+            slot, count = offset // SLICE_BYTES, planes.shape[0]
+
+            entry = {"key": key, "slot": slot, "count": count}
+            if meta is not None: entry["meta"] = meta
+            with open(self.index_path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+            self._index[key] = (slot, count)
+            if meta is not None: self._meta[key] = meta
@@ -0,0 +1,80 @@
+"""
+Parity check for the fused 2D decode path (Preprocessor._image_planes + LUT)
+against the reference torchvision pipeline (Preprocessor.transform).
+
+Images decoded at full scale must match bit for bit (same PIL resize, LUT built
+with the same float32 ops as ToTensor + Normalize). Large JPEGs decoded in draft
+mode may differ slightly, within the tolerances below.
+"""
+import os
+import tempfile
+import numpy as np
+import torch
+from PIL import Image
+from preprocessing import Preprocessor, INPUT_SIZE, DRAFT_FACTOR
+
+# Tolerances in normalized units (1 grey level ~ 0.017)
+EXACT_TOLERANCE = 1e-6
+DRAFT_MAX_TOLERANCE = 0.5
+DRAFT_MEAN_TOLERANCE = 0.02
+
+def compare(preprocessor, path):
+    """Returns (max abs diff, mean abs diff, decoded in draft mode)."""
+    reference = preprocessor.transform(Image.open(path).convert('RGB'))
+    fast = preprocessor._process_standard_image(path)[0]
+    diff = (fast - reference).abs()
+
+    with Image.open(path) as image:
+        draft = image.format == 'JPEG' and min(image.size) >= 2 * DRAFT_FACTOR * INPUT_SIZE
+    return diff.max().item(), diff.mean().item(), draft
+
+def synthetic_images(directory):
+    """Small and large, grayscale and color, JPEG and PNG test images."""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[:1024, :1024] / 1024 - 0.5
+    brain = ((xx ** 2 / 0.16 + yy ** 2 / 0.2 < 1) * 180 + rng.normal(0, 10, (1024, 1024))).clip(0, 255)
+    brain = brain.astype(np.uint8)
+
+    paths = []
+    for name, image in [
+        ("small_gray.jpg", Image.fromarray(brain).resize((176, 208))),
+        ("small_rgb.png", Image.fromarray(brain).resize((176, 208)).convert('RGB')),
+        ("large_gray.jpg", Image.fromarray(brain)),
+        ("large_rgb.jpg", Image.fromarray(np.stack([brain, brain // 2, 255 - brain], axis=-1))),
+    ]:
+        path = os.path.join(directory, name)
+        image.save(path, **({"quality": 95} if name.endswith('.jpg') else {}))
+        paths.append(path)
+    return paths
+
+def run_parity_check(paths):
+    preprocessor = Preprocessor()
+    failures = 0
+    for path in paths:
+        max_diff, mean_diff, draft = compare(preprocessor, path)
+        if draft:
+            ok = max_diff <= DRAFT_MAX_TOLERANCE and mean_diff <= DRAFT_MEAN_TOLERANCE
+        else:
+            ok = max_diff <= EXACT_TOLERANCE
+        failures += not ok
+        mode = "draft" if draft else "full "
+        print(f"{'✅' if ok else '❌'} [{mode}] {os.path.basename(path)}: max {max_diff:.6f}, mean {mean_diff:.6f}")
+    return failures
+
+if __name__ == "__main__":
+    torch.set_num_threads(1)
+
+    # Real dataset images if available, plus synthetic large JPEGs (the draft path)
+    dataset_images = []
+    if os.path.exists("FINAL_DATASET"):
+        for root, dirs, files in os.walk("FINAL_DATASET"):
+            dataset_images += [os.path.join(root, f) for f in files if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+            if len(dataset_images) >= 20: break
+
+    with tempfile.TemporaryDirectory() as tmp:
+        failures = run_parity_check(dataset_images[:20] + synthetic_images(tmp))
+
+    if failures:
+        print(f"\n❌ {failures} image(s) outside tolerance")
+        raise SystemExit(1)
+    print("\n✅ Fast decode path matches the reference transforms")
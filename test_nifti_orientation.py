@@ -1,11 +1,14 @@
 """
 Quick diagnostic script to visualize the difference between slice orientations.
-This helps verify we're extracting the correct anatomical view from NIfTI files.
+This helps verify we're extracting the correct anatomical view from NIfTI files:
+the three raw storage axes are shown next to the header-driven axial slice that
+the Preprocessor actually extracts (see preprocessing.axial_layout).
 """
 import nibabel as nib
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+from preprocessing import Preprocessor, axial_layout
 
 def visualize_all_orientations(nifti_path):
     """
@@ -22,6 +25,16 @@ def visualize_all_orientations(nifti_path):
     print(f"📊 NIfTI Shape: {nii_data.shape}")
     print(f"   Interpretation: (Axis 0: {nii_data.shape[0]} slices, "
           f"Axis 1: {nii_data.shape[1]} slices, Axis 2: {nii_data.shape[2]} slices)")
+
+    # Header-driven orientation (what the Preprocessor uses)
+    layout = axial_layout(nii_img)
+    axial_axis, transpose, flip_rows, flip_cols = layout
+    print(f"🧭 Orientation codes: {''.join(str(c) for c in nib.aff2axcodes(nii_img.affine))} "
+          f"(qform_code={int(nii_img.header.get('qform_code', 0))}, sform_code={int(nii_img.header.get('sform_code', 0))})")
+    print(f"   Axial (S-I) axis: {axial_axis}, transpose: {transpose}, "
+          f"flip rows: {flip_rows}, flip columns: {flip_cols}")
+    mid_axial = nii_data.shape[axial_axis] // 2
+    header_slice = Preprocessor._read_slices(nii_img, slice(mid_axial, mid_axial + 1), None, layout)[0]
     
     # Extract middle slices from each axis
     mid_0 = nii_data.shape[0] // 2
@@ -29,42 +42,35 @@ def visualize_all_orientations(nifti_path):
     mid_2 = nii_data.shape[2] // 2
     
     # Get slices
-    axial_slice = nii_data[mid_0, :, :]      # Axis 0 - AXIAL (what we want!)
-    coronal_slice = nii_data[:, mid_1, :]    # Axis 1 - CORONAL
-    sagittal_slice = nii_data[:, :, mid_2]   # Axis 2 - SAGITTAL (old incorrect method)
+    axis0_slice = nii_data[mid_0, :, :]      # Axis 0 - the old hardcoded "axial" assumption
+    axis1_slice = nii_data[:, mid_1, :]      # Axis 1
+    axis2_slice = nii_data[:, :, mid_2]      # Axis 2 - S-I axis of RAS-stored scans
     
     # Normalize each slice
     def normalize(slice_2d):
         return (slice_2d - np.min(slice_2d)) / (np.max(slice_2d) - np.min(slice_2d) + 1e-8)
     
-    axial_norm = normalize(axial_slice)
-    coronal_norm = normalize(coronal_slice)
-    sagittal_norm = normalize(sagittal_slice)
-    
     # Create visualization
-    fig, axes = plt.subplots(1, 3, figsize=(15, 5))
-    
-    axes[0].imshow(axial_norm, cmap='gray')
-    axes[0].set_title('AXIAL View (Axis 0)\n✅ CORRECT - Brain Cross-Section\n(What model was trained on)', 
+    fig, axes = plt.subplots(1, 4, figsize=(20, 5))
+
+    for i, raw_slice in enumerate([axis0_slice, axis1_slice, axis2_slice]):
+        axes[i].imshow(normalize(raw_slice), cmap='gray')
+        label = "AXIAL per header" if i == axial_axis else "storage order"
+        axes[i].set_title(f'Raw Axis {i}\n({label})', fontsize=12)
+        axes[i].axis('off')
+
+    axes[3].imshow(normalize(header_slice), cmap='gray')
+    axes[3].set_title('HEADER-DRIVEN AXIAL\n✅ What the model sees\n(anterior up, patient right on the left)',
                       fontsize=12, color='green', weight='bold')
-    axes[0].axis('off')
-    
-    axes[1].imshow(coronal_norm, cmap='gray')
-    axes[1].set_title('CORONAL View (Axis 1)\nFront View', fontsize=12)
-    axes[1].axis('off')
-    
-    axes[2].imshow(sagittal_norm, cmap='gray')
-    axes[2].set_title('SAGITTAL View (Axis 2)\n❌ OLD METHOD - Side Profile\n(Wrong orientation!)', 
-                      fontsize=12, color='red', weight='bold')
-    axes[2].axis('off')
+    axes[3].axis('off')
     
     plt.tight_layout()
     plt.savefig('nifti_orientation_comparison.png', dpi=150, bbox_inches='tight')
     print("\n✅ Visualization saved as 'nifti_orientation_comparison.png'")
     print("\n🔍 Notice the difference:")
-    print("   - AXIAL (left): Shows brain from top-down (like a CT scan)")
-    print("   - SAGITTAL (right): Shows brain from the side (profile view)")
-    print("\n💡 The model expects AXIAL views, so the fix is critical!")
+    print("   - The raw axes depend on how the scanner stored the volume")
+    print("   - HEADER-DRIVEN AXIAL (right): top-down cross-section, always in the same orientation")
+    print("\n💡 The model expects AXIAL views, so the axial axis is taken from the affine, not assumed!")
     plt.show()
 
 if __name__ == "__main__":
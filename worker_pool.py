@@ -0,0 +1,162 @@
+"""
+Multi-process inference pool for many-core CPU servers.
+
+The model is loaded ONCE in the parent process and its weights are moved to
+shared memory (model.share_memory()). Worker processes receive that shared
+model instead of loading their own copy, so total memory stays near one model
+no matter how many workers run. Each worker pins a few intra-op threads and
+pulls scans from a shared queue.
+
+Balancing: N workers x T threads per worker should roughly equal the number of
+physical cores. Many small workers give the best throughput for single scans;
+fewer, wider workers give lower latency per scan (see plan_workers).
+
+Usage:
+    python worker_pool.py --model models/alzheimer_resnet50_best.pth --workers 4 --threads-per-worker 2 scan1.jpg scan2.nii.gz
+"""
+import argparse
+import os
+import queue
+import torch
+import torch.multiprocessing as mp
+from inference import AlzheimerPredictor
+
+# --- CONFIGURATION ---
+DEFAULT_MODEL_PATH = "models/alzheimer_resnet50_best.pth"
+DEFAULT_THREADS_PER_WORKER = 2 # ResNet-50 scales poorly past a few intra-op threads
+
+def plan_workers(workers=None, threads_per_worker=None, cpu_count=None):
+    """
+    Splits the available cores between processes and intra-op threads.
+    Returns: (workers, threads_per_worker)
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if workers and threads_per_worker:
+        return workers, threads_per_worker
+    if workers:
+        return workers, max(1, cpu_count // workers)
+    threads_per_worker = threads_per_worker or min(DEFAULT_THREADS_PER_WORKER, cpu_count)
+    return max(1, cpu_count // threads_per_worker), threads_per_worker
+
+def _worker_main(worker_idx, model, model_path, threads, optimize, tasks, results):
+    """
+    Worker process: wraps the shared model in a predictor and serves the task queue.
+    Posts ("started", worker_idx, job_id) when it takes a job, so the parent knows
+    which job is lost if the process dies, then ("done", worker_idx, result).
+    """
+    torch.set_num_threads(threads)
+    predictor = AlzheimerPredictor(model_path, optimize=optimize, model=model)
+
+    while True:
+        task = tasks.get()
+        if task is None: break # Shutdown sentinel
+        job_id, path, want_heatmap = task
+        results.put(("started", worker_idx, job_id))
+        try:
+            result = predictor.predict(path)
+            cam = result.cam() if want_heatmap else None
+            image = result.image if want_heatmap else None
+            results.put(("done", worker_idx, (job_id, result.class_name, result.confidence, cam, image, None)))
+        except Exception as e:
+            results.put(("done", worker_idx, (job_id, "Error", 0.0, None, None, str(e))))
+
+class WorkerPool:
+    """
+    Process pool of AlzheimerPredictor workers sharing one copy of the weights.
+    Usage:
+        with WorkerPool(model_path, workers=4, threads_per_worker=2) as pool:
+            for path, result in pool.map(paths):
+                print(path, result["prediction"], result["confidence"])
+    """
+    def __init__(self, model_path, workers=None, threads_per_worker=None, optimize=True):
+        self.workers, self.threads_per_worker = plan_workers(workers, threads_per_worker)
+        print(f"⚙️ Worker pool: {self.workers} workers x {self.threads_per_worker} threads")
+
+        # 1. Load once, then move every parameter/buffer storage to shared memory
+        model = AlzheimerPredictor.load_model(model_path, optimize=optimize)
+        model.share_memory()
+
+        # 2. Spawn workers (spawn is safe with torch's thread pools and works on macOS/Windows);
+        #    the model is passed by shared-memory handle, not copied
+        ctx = mp.get_context("spawn")
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        self.processes = [
+            ctx.Process(target=_worker_main, daemon=True,
+                        args=(i, model, model_path, self.threads_per_worker, optimize, self.tasks, self.results))
+            for i in range(self.workers)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def map(self, paths, heatmaps=False, max_in_flight=None):
+        """
+        Scores `paths`, yielding (path, result) pairs as they complete (unordered).
+        At most max_in_flight scans are queued at once to bound memory.
+        A scan whose worker process dies (e.g. OOM-killed) is yielded with an error;
+        the remaining workers keep going. Raises RuntimeError if every worker died.
+        result: {"prediction", "confidence", "cam", "image", "error"}
+        """
+        max_in_flight = max_in_flight or 2 * self.workers
+        paths = list(paths)
+        next_job, in_flight = 0, 0
+        running = {} # worker index -> job it is processing
+        while next_job < len(paths) or in_flight:
+            while next_job < len(paths) and in_flight < max_in_flight:
+                self.tasks.put((next_job, paths[next_job], heatmaps))
+                next_job += 1
+                in_flight += 1
+
+            try:
+                kind, worker_idx, payload = self.results.get(timeout=1.0)
+            except queue.Empty:
+                # Jobs held by dead workers will never complete: report them as failed
+                for worker_idx, job_id in list(running.items()):
+                    exitcode = self.processes[worker_idx].exitcode
+                    if exitcode is None: continue
+                    del running[worker_idx]
+                    in_flight -= 1
+                    yield paths[job_id], {"prediction": "Error", "confidence": 0.0, "cam": None, "image": None,
+                                          "error": f"Inference worker died (exit code {exitcode})"}
+                if in_flight and not any(p.is_alive() for p in self.processes):
+                    raise RuntimeError("All inference workers died")
+                continue
+
+            if kind == "started":
+                running[worker_idx] = payload
+                continue
+            running.pop(worker_idx, None)
+            job_id, class_name, confidence, cam, image, error = payload
+            in_flight -= 1
+            yield paths[job_id], {"prediction": class_name, "confidence": confidence,
+                                  "cam": cam, "image": image, "error": error}
+
+    def close(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive(): process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Score scans with a multi-process inference pool")
+    parser.add_argument("paths", nargs="+", help="Scan files (.nii/.nii.gz/.jpg/.png)")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="Default: cores / threads-per-worker")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help=f"Intra-op threads per worker (default {DEFAULT_THREADS_PER_WORKER})")
+    args = parser.parse_args()
+
+    with WorkerPool(args.model, args.workers, args.threads_per_worker) as pool:
+        for path, result in pool.map(args.paths):
+            status = result["error"] or f"{result['prediction']} ({result['confidence']:.2f}%)"
+            print(f"{path}: {status}")
+
+if __name__ == "__main__":
+    main()